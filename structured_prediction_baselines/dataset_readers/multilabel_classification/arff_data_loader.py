@@ -0,0 +1,197 @@
+"""Data loader that keeps a complete split of an arff dataset as contiguous tensors."""
+
+from typing import List, Dict, Iterator, Optional, Union
+import logging
+import math
+import numpy as np
+import torch
+from allennlp.common.checks import ConfigurationError
+from allennlp.data.data_loaders.data_loader import DataLoader, TensorDict
+from allennlp.data.dataset_readers.dataset_reader import DatasetReader
+from allennlp.data.instance import Instance
+from allennlp.data.vocabulary import Vocabulary
+from structured_prediction_baselines.dataset_readers.multilabel_classification.arff_reader import (
+    ARFFReader,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@DataLoader.register("arff-columnar")
+class ARFFColumnarDataLoader(DataLoader):
+    """
+    Serves batches of multilabel data read by :class:`ARFFReader` from two contiguous tensors:
+    the features of shape (num_examples, num_features) and the multi-hot labels of shape
+    (num_examples, num_labels). A batch is produced by slicing (or `index_select` with a
+    shuffled permutation), hence there is no per-instance tensorization or padding in collate.
+
+    The batches have the same keys as the ones produced by the default data loader,
+    i.e., `x`, `labels` and `meta`, where `meta` only contains the `idx` of the examples.
+
+    Once the tensors are built, the examples read by the reader are dropped. They are read
+    again only if needed, i.e., for `iter_instances()` or after a new `index_with()`.
+    """
+
+    def __init__(
+        self,
+        reader: DatasetReader,
+        data_path: str,
+        batch_size: int,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        pin_memory: bool = False,
+        cuda_device: Optional[Union[int, str, torch.device]] = None,
+    ) -> None:
+        """
+        Args:
+            reader: Has to be an :class:`ARFFReader` with dense features.
+            data_path: glob pattern for files containing folds to read
+            batch_size: Number of examples per batch.
+            shuffle: Shuffle the examples every epoch.
+            drop_last: Drop the last batch if it is smaller than `batch_size`.
+            pin_memory: Keep the batches in pinned memory so that the copy to the
+                gpu is asynchronous.
+            cuda_device: If given, the batches are moved to this device.
+        """
+
+        if not isinstance(reader, ARFFReader):
+            raise ConfigurationError(
+                "arff-columnar data loader only works with the arff reader"
+            )
+
+        if reader.sparse_features:
+            raise ConfigurationError(
+                "arff-columnar data loader does not support sparse_features"
+            )
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.reader = reader
+        self.data_path = data_path
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pin_memory = pin_memory
+        self.cuda_device: Optional[torch.device] = None
+
+        if cuda_device is not None:
+            self.set_target_device(
+                torch.device(cuda_device)
+                if not isinstance(cuda_device, int)
+                else torch.device("cuda", cuda_device)
+            )
+        self._data: Optional[List[Dict]] = None
+        self._num_examples: Optional[int] = None
+        self._vocab: Optional[Vocabulary] = None
+        self._x: Optional[torch.Tensor] = None
+        self._labels: Optional[torch.Tensor] = None
+        self._meta: List[Dict] = []
+
+    @property
+    def data(self) -> List[Dict]:
+        if self._data is None:
+            self._data = self.reader.read_internal(self.data_path)
+            self._num_examples = len(self._data)
+
+        return self._data
+
+    def index_with(self, vocab: Vocabulary) -> None:
+        self._vocab = vocab
+        self._x = None
+        self._labels = None
+
+    def set_target_device(self, device: torch.device) -> None:
+        self.cuda_device = device
+
+    def iter_instances(self) -> Iterator[Instance]:
+        for ex in self.data:
+            instance = self.reader.text_to_instance(**ex)
+
+            if self._vocab is not None:
+                instance.index_fields(self._vocab)
+
+            yield instance
+
+    def _build_tensors(self) -> None:
+        if self._vocab is None:
+            raise ValueError(
+                "Call index_with() before iterating over the batches."
+            )
+        data = self.data
+        logger.info(f"Building tensors for {len(data)} examples")
+        self._x = torch.from_numpy(
+            np.stack([ex["x"] for ex in data]).astype(np.single)
+        )
+        # same layout as MultiLabelField
+        labels = torch.zeros(
+            (len(data), self._vocab.get_vocab_size("labels")),
+            dtype=torch.long,
+        )
+
+        for i, ex in enumerate(data):
+            labels[
+                i,
+                [
+                    self._vocab.get_token_index(label, "labels")
+                    for label in ex["labels"]
+                ],
+            ] = 1
+        self._labels = labels
+        self._meta = [{"idx": ex["idx"]} for ex in data]
+
+        if self.pin_memory:
+            self._x = self._x.pin_memory()
+            self._labels = self._labels.pin_memory()
+        # the tensors have everything needed for the batches
+        self._data = None
+
+    def __len__(self) -> int:
+        num_examples = (
+            self._num_examples
+            if self._num_examples is not None
+            else len(self.data)
+        )
+
+        if self.drop_last:
+            return num_examples // self.batch_size
+
+        return math.ceil(num_examples / self.batch_size)
+
+    def __iter__(self) -> Iterator[TensorDict]:
+        if self._x is None or self._labels is None:
+            self._build_tensors()
+        assert self._x is not None and self._labels is not None
+        num_examples = self._x.shape[0]
+
+        if self.shuffle:
+            order: Optional[torch.Tensor] = torch.randperm(num_examples)
+        else:
+            order = None
+
+        for start in range(0, num_examples, self.batch_size):
+            end = min(start + self.batch_size, num_examples)
+
+            if self.drop_last and (end - start) < self.batch_size:
+                break
+
+            if order is None:  # contiguous slice, no copy
+                x = self._x[start:end]
+                labels = self._labels[start:end]
+                meta = self._meta[start:end]
+            else:
+                index = order[start:end]
+                x = self._x.index_select(0, index)
+                labels = self._labels.index_select(0, index)
+                meta = [self._meta[i] for i in index.tolist()]
+
+                if self.pin_memory:
+                    x = x.pin_memory()
+                    labels = labels.pin_memory()
+
+            if self.cuda_device is not None:
+                x = x.to(self.cuda_device, non_blocking=self.pin_memory)
+                labels = labels.to(
+                    self.cuda_device, non_blocking=self.pin_memory
+                )
+
+            yield {"x": x, "labels": labels, "meta": meta}
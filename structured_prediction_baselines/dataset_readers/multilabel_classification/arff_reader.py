@@ -9,14 +9,25 @@ from typing import (
     cast,
     Tuple,
     Iterable,
+    Optional,
+    Union,
 )
+import os
 import sys
 import logging
 import json
+import hashlib
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import scipy.sparse as sp
 from allennlp.data.dataset_readers.dataset_reader import DatasetReader
 from allennlp.data.fields import ArrayField, MetadataField, MultiLabelField
 from allennlp.data.instance import Instance
+from structured_prediction_baselines.dataset_readers.sparse_array_field import (
+    SparseArrayField,
+)
 from skmultilearn.dataset import load_from_arff
 from wcmatch import glob
 import torch
@@ -34,7 +45,7 @@ logger = logging.getLogger(__name__)
 class InstanceFields(TypedDict):
     """Contents which form an instance"""
 
-    x: ArrayField
+    x: Union[ArrayField, SparseArrayField]
     labels: MultiLabelField  #: types
 
 
@@ -54,9 +65,16 @@ class ARFFReader(DatasetReader):
 
     """
 
+    all_metadata_keys = ("x", "labels", "using_tc", "idx")
+
     def __init__(
         self,
         num_labels: int,
+        use_cache: bool = False,
+        cache_dir: Optional[str] = None,
+        sparse_features: bool = False,
+        metadata_keys: Optional[List[str]] = None,
+        num_parsing_workers: int = 1,
         **kwargs: Any,
     ) -> None:
         """
@@ -64,17 +82,52 @@ class ARFFReader(DatasetReader):
             num_labels: Total number of labels for the dataset.
                 Make sure that this is correct. If this is incorrect, the code will not throw error but
                 will have a silent bug.
+            use_cache: If True, the parsed features and labels of every arff file are saved
+                as `.npy` files the first time the file is read, and later reads memory-map them
+                instead of parsing the arff file. The cache is rebuilt when the content of the
+                arff file changes.
+            cache_dir: Directory to keep the cache in. By default, it is kept next to the arff file.
+            sparse_features: Keep the features sparse (CSR) instead of densifying them.
+                The x field is then a :class:`SparseArrayField` which is collated into
+                a sparse tensor of shape (batch, num_features).
+            metadata_keys: Which of "x", "labels", "using_tc" and "idx" to keep in the
+                metadata of every instance. All are kept by default. Keeping "x" and "labels"
+                holds a second copy of the data in memory, so for large datasets use, for instance,
+                `["idx"]`.
+            num_parsing_workers: If more than 1, the files matched by the glob pattern
+                are parsed in parallel using a pool of these many processes. When the reader
+                runs in a daemonic process, for instance, a data loader worker, they are parsed
+                serially.
             **kwargs: Parent class args.
                 `Reference <https://github.com/allenai/allennlp/blob/master/allennlp/data/dataset_readers/dataset_reader.py>`_
 
         """
         super().__init__(**kwargs)
         self.num_labels = num_labels
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.sparse_features = sparse_features
+        self.num_parsing_workers = num_parsing_workers
+
+        if metadata_keys is not None:
+            unknown_keys = set(metadata_keys) - set(self.all_metadata_keys)
+
+            if unknown_keys:
+                raise ValueError(
+                    f"Unknown metadata_keys {unknown_keys}. "
+                    f"Should be from {self.all_metadata_keys}"
+                )
+        self.metadata_keys = set(
+            metadata_keys
+            if metadata_keys is not None
+            else self.all_metadata_keys
+        )
 
     def example_to_fields(
         self,
-        x: List[float],
+        x: Union[List[float], np.ndarray, sp.spmatrix],
         labels: List[str],
+        idx: Optional[str] = None,
         meta: Dict = None,
         **kwargs: Any,
     ) -> InstanceFields:
@@ -85,6 +138,7 @@ class ARFFReader(DatasetReader):
         Args:
             x: data point in the 2D space
             labels: toy data true labels
+            idx: unique id of the example (used, for instance, by warm-start caches)
             meta: None
             **kwargs: TODO
 
@@ -98,11 +152,27 @@ class ARFFReader(DatasetReader):
         if meta is None:
             meta = {}
 
-        meta["x"] = x
-        meta["labels"] = labels
-        meta["using_tc"] = False
+        if "x" in self.metadata_keys:
+            # rows read from the cache are views of a memmap,
+            # which would keep the whole file mapped. Copy them.
+            meta["x"] = np.array(x) if isinstance(x, np.memmap) else x
+
+        if "labels" in self.metadata_keys:
+            meta["labels"] = labels
+
+        if "using_tc" in self.metadata_keys:
+            meta["using_tc"] = False
+
+        if idx is not None and "idx" in self.metadata_keys:
+            meta["idx"] = idx
 
-        x_field = ArrayField(np.array(x), dtype=np.single)
+        if sp.issparse(x):
+            x = x.tocsr()
+            x_field: Union[ArrayField, SparseArrayField] = SparseArrayField(
+                x.indices, x.data, x.shape[-1], dtype=np.single
+            )
+        else:
+            x_field = ArrayField(np.array(x, dtype=np.single), dtype=np.single)
         labels_field = MultiLabelField(labels)
 
         return {
@@ -112,7 +182,7 @@ class ARFFReader(DatasetReader):
 
     def text_to_instance(  # type:ignore
         self,
-        x: List[float],
+        x: Union[List[float], np.ndarray, sp.spmatrix],
         labels: List[str],
         **kwargs: Any,
     ) -> Instance:
@@ -161,40 +231,200 @@ class ARFFReader(DatasetReader):
             List of json containing data examples
 
         """
-        data = []
-        for file_ in glob.glob(file_path, flags=glob.EXTGLOB):
-            logger.info(f"Reading {file_}")
-            x, y, feature_names, label_names = load_from_arff(
-                file_,
-                label_count=self.num_labels,
-                return_attribute_definitions=True,
+        files = glob.glob(file_path, flags=glob.EXTGLOB)
+        num_workers = min(self.num_parsing_workers, len(files))
+
+        if num_workers > 1 and multiprocessing.current_process().daemon:
+            # daemonic processes, like the workers of a multi-process
+            # data loader, are not allowed to have children
+            logger.info(
+                "Parsing the files serially as the reader runs in a daemonic process."
             )
-            data += self._arff_dataset(
-                x.toarray(), y.toarray(), feature_names, label_names
+            num_workers = 1
+
+        if num_workers > 1:
+            # the folds are parsed in separate processes and
+            # only the arrays are sent back
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                folds = list(pool.map(self.load_fold, files))
+        else:
+            folds = [self.load_fold(file_) for file_ in files]
+        data = []
+
+        for file_, (x, y, label_names) in zip(files, folds):
+            data.extend(
+                self._arff_dataset(
+                    x,
+                    y,
+                    label_names,
+                    idx_prefix=os.path.basename(file_),
+                )
             )
 
         return data
 
+    def load_fold(
+        self, file_: str
+    ) -> Tuple[Union[np.ndarray, sp.csr_matrix], np.ndarray, List[str]]:
+        """Parses a single arff file, or loads it from the cache.
+
+        Returns:
+            x: features of shape (num_examples, num_features), CSR if `sparse_features`
+            y: multi-hot labels of shape (num_examples, num_labels)
+            label_names: names of the labels
+        """
+
+        if self.use_cache:
+            cached = self._load_cache(file_)
+
+            if cached is not None:
+                return cached
+        logger.info(f"Reading {file_}")
+        x, y, feature_names, label_names = load_from_arff(
+            file_,
+            label_count=self.num_labels,
+            return_attribute_definitions=True,
+        )
+        if self.sparse_features:
+            x = sp.csr_matrix(x, dtype=np.single)
+        else:
+            x = x.toarray().astype(np.single)
+        y = y.toarray().astype(np.int8)
+        assert x.shape[-1] == len(feature_names)
+        assert y.shape[-1] == len(label_names)
+        label_names = [l_[0] for l_ in label_names]
+
+        if self.use_cache:
+            self._write_cache(file_, x, y, label_names)
+
+        return x, y, label_names
+
+    def _cache_path(self, file_: str) -> str:
+        cache_dir = self.cache_dir or os.path.dirname(os.path.abspath(file_))
+
+        return os.path.join(cache_dir, os.path.basename(file_) + ".cache")
+
+    @staticmethod
+    def _file_hash(file_: str) -> str:
+        sha1 = hashlib.sha1()
+        with open(file_, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+
+        return sha1.hexdigest()
+
+    def _load_cache(
+        self, file_: str
+    ) -> Optional[
+        Tuple[Union[np.ndarray, sp.csr_matrix], np.ndarray, List[str]]
+    ]:
+        cache_path = self._cache_path(file_)
+        info_file = os.path.join(cache_path, "info.json")
+
+        if not os.path.isfile(info_file):
+            return None
+        with open(info_file) as f:
+            info = json.load(f)
+        stat = os.stat(file_)
+
+        if (info["mtime"], info["size"]) != (stat.st_mtime, stat.st_size):
+            # the file was touched or modified. Only the content matters.
+
+            if self._file_hash(file_) != info["sha1"]:
+                logger.info(f"Cache for {file_} is stale.")
+
+                return None
+            info["mtime"], info["size"] = stat.st_mtime, stat.st_size
+            with open(info_file, "w") as f:
+                json.dump(info, f)
+
+        if (info["num_labels"], info.get("sparse", False)) != (
+            self.num_labels,
+            self.sparse_features,
+        ):
+            return None
+        logger.info(f"Reading {file_} from cache {cache_path}")
+
+        if self.sparse_features:
+            x = sp.csr_matrix(
+                tuple(
+                    np.load(os.path.join(cache_path, f"x_{part}.npy"))
+                    for part in ("data", "indices", "indptr")
+                ),
+                shape=tuple(info["shape"]),
+            )
+        else:
+            x = np.load(os.path.join(cache_path, "x.npy"), mmap_mode="r")
+        y = np.load(os.path.join(cache_path, "y.npy"), mmap_mode="r")
+
+        return x, y, info["label_names"]
+
+    def _write_cache(
+        self,
+        file_: str,
+        x: Union[np.ndarray, sp.csr_matrix],
+        y: np.ndarray,
+        label_names: List[str],
+    ) -> None:
+        cache_path = self._cache_path(file_)
+        stat = os.stat(file_)
+        info = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha1": self._file_hash(file_),
+            "num_labels": self.num_labels,
+            "label_names": label_names,
+            "sparse": sp.issparse(x),
+            "shape": list(x.shape),
+        }
+        # write to a temporary dir and move, so that a
+        # partially written cache is never read.
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        if sp.issparse(x):
+            for part in ("data", "indices", "indptr"):
+                np.save(
+                    os.path.join(tmp_path, f"x_{part}.npy"), getattr(x, part)
+                )
+        else:
+            np.save(os.path.join(tmp_path, "x.npy"), x)
+        np.save(os.path.join(tmp_path, "y.npy"), y)
+        with open(os.path.join(tmp_path, "info.json"), "w") as f:
+            json.dump(info, f)
+        # os.replace cannot overwrite a non-empty dir, so a stale cache is first
+        # moved aside (atomically) and removed only once the new one is in place.
+        old_path = f"{cache_path}.old{os.getpid()}"
+        try:
+            os.replace(cache_path, old_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # another process wrote its cache in the meantime, use that one.
+            logger.info(f"Cache for {file_} was written by another process.")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            logger.info(f"Cached {file_} at {cache_path}")
+        shutil.rmtree(old_path, ignore_errors=True)
+
     def _arff_dataset(
         self,
-        x: np.ndarray,
+        x: Union[np.ndarray, sp.csr_matrix],
         y: np.ndarray,
-        feature_names: List[Tuple[str, Any]],
-        label_names: List[Tuple[str, Any]],
+        label_names: List[str],
+        idx_prefix: str = "",
     ) -> List[Dict]:
-        num_features = len(feature_names)
-        assert x.shape[-1] == num_features
-        num_total_labels = len(label_names)
-        assert y.shape[-1] == num_total_labels
-        all_labels = np.array([l_[0] for l_ in label_names])
+        all_labels = np.array(label_names)
         data = [
             {
-                "x": xi.tolist(),
+                "x": xi,
                 "labels": (all_labels[yi == 1]).tolist(),
-                "idx": str(i),
+                # the prefix keeps ids unique across folds
+                "idx": f"{idx_prefix}:{i}" if idx_prefix else str(i),
             }
             for i, (xi, yi) in enumerate(zip(x, y))
-            if any(yi)  # skip ex with empty label set
+            if yi.any()  # skip ex with empty label set
         ]
 
         return data
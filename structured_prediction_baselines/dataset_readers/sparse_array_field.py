@@ -0,0 +1,84 @@
+from typing import Dict, List
+from overrides import overrides
+from allennlp.data.fields.field import Field
+import numpy as np
+import torch
+
+
+class SparseArrayField(Field[torch.Tensor]):
+    """
+    A fixed size 1D array of which only the non-zero entries are stored.
+
+    The field is converted to a sparse COO tensor of shape `(size,)`
+    and a batch of them is collated into a sparse COO tensor of shape `(batch, size)`.
+    """
+
+    __slots__ = ["indices", "values", "size", "dtype"]
+
+    def __init__(
+        self,
+        indices: np.ndarray,
+        values: np.ndarray,
+        size: int,
+        dtype: np.dtype = np.single,
+    ) -> None:
+        """
+        Args:
+            indices: positions of the non-zero entries
+            values: the non-zero entries
+            size: size of the (dense) array
+        """
+        assert len(indices) == len(values)
+        self.indices = indices
+        self.values = values
+        self.size = size
+        self.dtype = dtype
+
+    @overrides
+    def get_padding_lengths(self) -> Dict[str, int]:
+        return {}
+
+    @overrides
+    def as_tensor(self, padding_lengths: Dict[str, int]) -> torch.Tensor:
+        return torch.sparse_coo_tensor(
+            torch.from_numpy(np.asarray(self.indices, dtype=np.int64)).view(
+                1, -1
+            ),
+            torch.from_numpy(np.asarray(self.values, dtype=self.dtype)),
+            (self.size,),
+        )
+
+    @overrides
+    def empty_field(self) -> "SparseArrayField":
+        return SparseArrayField(
+            np.array([], dtype=np.int64),
+            np.array([], dtype=self.dtype),
+            self.size,
+            dtype=self.dtype,
+        )
+
+    @overrides
+    def batch_tensors(self, tensor_list: List[torch.Tensor]) -> torch.Tensor:  # type: ignore
+        rows = torch.cat(
+            [
+                torch.full((t._nnz(),), i, dtype=torch.long)
+                for i, t in enumerate(tensor_list)
+            ]
+        )
+        columns = torch.cat([t._indices()[0] for t in tensor_list])
+        values = torch.cat([t._values() for t in tensor_list])
+
+        return torch.sparse_coo_tensor(
+            torch.stack((rows, columns)),
+            values,
+            (len(tensor_list), self.size),
+        ).coalesce()
+
+    def __str__(self) -> str:
+        return (
+            f"SparseArrayField with size: {self.size}, "
+            f"{len(self.indices)} non-zeros and dtype: {self.dtype}."
+        )
+
+    def __len__(self) -> int:
+        return self.size
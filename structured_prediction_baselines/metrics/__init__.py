@@ -1,5 +1,6 @@
 from .multilabel_classification_f1 import (
     MultilabelClassificationF1,
+    MultilabelClassificationFusedF1,
     MultilabelClassificationRelaxedF1,
 )
 from .multilabel_classification_mean_average_precision import (
@@ -1,16 +1,32 @@
-"""Implements F1 using sklearn"""
+"""Implements per instance F1"""
 from typing import List, Tuple, Union, Dict, Any, Optional
 
-from sklearn.metrics import f1_score
-from allennlp.training.metrics import Metric, Average
+from allennlp.training.metrics import Metric
 import torch
+from structured_prediction_baselines.metrics.tensor_average import (
+    TensorAverage,
+)
 from structured_prediction_baselines.modules.oracle_value_function.multilabel_per_instance_f1 import (
     compute,
 )
 
 
+def f1(
+    labels: torch.Tensor,  #: (batch, num_labels) 0/1
+    predicted_labels: torch.Tensor,  #: (batch, num_labels) 0/1
+) -> torch.Tensor:
+    """Per example F1, same as sklearn's `f1_score`, i.e., 0 when there are no true
+    and no predicted labels."""
+    true_positives = torch.sum(labels * predicted_labels, dim=-1)
+    denominator = torch.sum(labels, dim=-1) + torch.sum(
+        predicted_labels, dim=-1
+    )
+
+    return 2.0 * true_positives / denominator.clamp_min(1)
+
+
 @Metric.register("multilabel-f1-score-with-threshold")
-class MultilabelClassificationF1(Average):
+class MultilabelClassificationF1(TensorAverage):
 
     """Computes F1 score between true and predicted labels"""
 
@@ -22,22 +38,13 @@ class MultilabelClassificationF1(Average):
         self, predictions: torch.Tensor, gold_labels: torch.Tensor
     ) -> None:  # type: ignore
 
-        labels, scores = [
-            t.cpu().numpy()
-            for t in self.detach_tensors(gold_labels, predictions)
-        ]
-        scores[scores < self.threshold] = 0
-        scores[scores >= self.threshold] = 1
-
-        for single_example_labels, single_example_scores in zip(
-            labels, scores
-        ):
-            sample_f1 = f1_score(single_example_labels, single_example_scores)
-            super().__call__(sample_f1)
+        labels, scores = self.detach_tensors(gold_labels, predictions)
+        predicted_labels = (scores >= self.threshold).to(dtype=scores.dtype)
+        super().__call__(f1(labels.to(dtype=scores.dtype), predicted_labels))
 
 
 @Metric.register("multilabel-relaxed-f1-score")
-class MultilabelClassificationRelaxedF1(Average):
+class MultilabelClassificationRelaxedF1(TensorAverage):
 
     """Computes F1 score between true and predicted labels.
     However, this metric uses the predictions between [0,1]
@@ -52,13 +59,140 @@ class MultilabelClassificationRelaxedF1(Average):
         self, predictions: torch.Tensor, gold_labels: torch.Tensor
     ) -> None:  # type: ignore
 
-        labels, scores = [
-            t.cpu().numpy()
-            for t in self.detach_tensors(gold_labels, predictions)
-        ]
-        per_instance_f1s = compute(
-            gold_labels, predictions
-        ).tolist()  # (batch,)
+        labels, scores = self.detach_tensors(gold_labels, predictions)
+        super().__call__(compute(labels, scores))  # (batch,)
+
+
+@Metric.register("multilabel-fused-f1")
+class MultilabelClassificationFusedF1(Metric):
+
+    """Computes, in one pass over a batch of (batch, num_labels) predictions in [0,1]:
+
+        1. Per example F1 (averaged over examples) at several thresholds.
+        2. Relaxed F1 (see :class:`MultilabelClassificationRelaxedF1`).
+        3. Per label true positive, false positive and false negative counts at
+            every threshold, which give the macro F1 over the labels.
+
+    All the state is kept on the device of the predictions.
+    `get_metric` reports the F1s at `threshold` as well as the sweep over `sweep_thresholds`,
+    which can be used to pick the decision threshold without running inference again.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        sweep_thresholds: Optional[List[float]] = None,
+    ) -> None:
+        """
+        Args:
+            threshold: The decision threshold for the main "fixed_f1" and "macro_f1".
+            sweep_thresholds: Additional thresholds to report F1s for. If None,
+                0.1, 0.2, ..., 0.9 are used. Pass an empty list to disable the sweep.
+        """
+        super().__init__()
+
+        if sweep_thresholds is None:
+            sweep_thresholds = [i / 10 for i in range(1, 10)]
+        self.threshold = threshold
+        self.thresholds = sorted(set([threshold] + list(sweep_thresholds)))
+        self._threshold_index = self.thresholds.index(threshold)
+        self.reset()
+
+    def __call__(
+        self, predictions: torch.Tensor, gold_labels: torch.Tensor
+    ) -> None:  # type: ignore
+        labels, scores = self.detach_tensors(gold_labels, predictions)
+        labels = labels.to(dtype=scores.dtype)
+        thresholds = torch.tensor(
+            self.thresholds, dtype=scores.dtype, device=scores.device
+        ).view(-1, 1, 1)
+        # (num_thresholds, batch, num_labels)
+        predicted_labels = (scores.unsqueeze(0) >= thresholds).to(
+            dtype=scores.dtype
+        )
+        true_positives = predicted_labels * labels
+        # per label counts: (num_thresholds, num_labels)
+        tp = torch.sum(true_positives, dim=1)
+        predicted = torch.sum(predicted_labels, dim=1)
+        gold = torch.sum(labels, dim=0)
+        # per example F1: (num_thresholds, batch)
+        example_f1 = (
+            2.0
+            * torch.sum(true_positives, dim=-1)
+            / (
+                torch.sum(labels, dim=-1) + torch.sum(predicted_labels, dim=-1)
+            ).clamp_min(1)
+        )
+
+        if self._true_positives is None:
+            self._true_positives = torch.zeros_like(tp)
+            self._false_positives = torch.zeros_like(tp)
+            self._false_negatives = torch.zeros_like(tp)
+            self._example_f1 = torch.zeros_like(tp[:, 0])
+            self._relaxed_f1 = torch.zeros_like(tp[0, 0])
+        assert self._false_positives is not None
+        assert self._false_negatives is not None
+        self._true_positives += tp
+        self._false_positives += predicted - tp
+        self._false_negatives += gold - tp
+        self._example_f1 += torch.sum(example_f1, dim=-1)
+        self._relaxed_f1 += torch.sum(compute(labels, scores))
+        self._count += labels.shape[0]
+
+    def get_metric(self, reset: bool = False) -> Dict[str, float]:
+        if self._true_positives is None or self._count == 0:
+            fixed_f1 = [0.0] * len(self.thresholds)
+            macro_f1 = [0.0] * len(self.thresholds)
+            relaxed_f1 = 0.0
+        else:
+            assert self._false_positives is not None
+            assert self._false_negatives is not None
+            # same as sklearn, F1 of a label without true and predicted examples is 0
+            label_f1 = (
+                2.0
+                * self._true_positives
+                / (
+                    2.0 * self._true_positives
+                    + self._false_positives
+                    + self._false_negatives
+                ).clamp_min(1)
+            )
+            # single sync for everything
+            values = torch.cat(
+                (
+                    self._example_f1 / self._count,
+                    torch.mean(label_f1, dim=-1),
+                    (self._relaxed_f1 / self._count).view(1),
+                )
+            ).tolist()
+            num_thresholds = len(self.thresholds)
+            fixed_f1 = values[:num_thresholds]
+            macro_f1 = values[num_thresholds : 2 * num_thresholds]
+            relaxed_f1 = values[-1]
+        metrics = {
+            "fixed_f1": fixed_f1[self._threshold_index],
+            "macro_f1": macro_f1[self._threshold_index],
+            "relaxed_f1": relaxed_f1,
+        }
+
+        if len(self.thresholds) > 1:
+            for threshold, f1_, macro_f1_ in zip(
+                self.thresholds, fixed_f1, macro_f1
+            ):
+                metrics[f"fixed_f1@{threshold:g}"] = f1_
+                metrics[f"macro_f1@{threshold:g}"] = macro_f1_
+            best = max(range(len(self.thresholds)), key=lambda i: fixed_f1[i])
+            metrics["best_threshold"] = self.thresholds[best]
+
+        if reset:
+            self.reset()
+
+        return metrics
 
-        for f1 in per_instance_f1s:
-            super().__call__(f1)
+    def reset(self) -> None:
+        self._true_positives: Optional[torch.Tensor] = None
+        self._false_positives: Optional[torch.Tensor] = None
+        self._false_negatives: Optional[torch.Tensor] = None
+        self._example_f1: Optional[torch.Tensor] = None
+        self._relaxed_f1: Optional[torch.Tensor] = None
+        self._count = 0
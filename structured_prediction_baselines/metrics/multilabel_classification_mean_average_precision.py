@@ -1,29 +1,79 @@
-"""Implements mean average precision using sklearn"""
+"""Implements mean average precision"""
 from typing import List, Tuple, Union, Dict, Any, Optional
 
-from sklearn.metrics import average_precision_score
-from allennlp.training.metrics import Metric, Average
+from allennlp.training.metrics import Metric
 import torch
 
 
+def average_precision(
+    scores: torch.Tensor,  #: (batch, num_labels)
+    labels: torch.Tensor,  #: (batch, num_labels) 0/1
+) -> torch.Tensor:
+    """Average precision of every row, computed on the device of the inputs.
+
+    Same as `sklearn.metrics.average_precision_score` applied to every row,
+    including the treatment of tied scores: all the labels with the same score form
+    one threshold and hence use the precision at the end of their tie group.
+    Like recent versions of sklearn, the result is 0 for a row without positive labels.
+
+    Returns:
+        Tensor of shape (batch,) in double precision.
+    """
+    num_labels = scores.shape[-1]
+    sorted_scores, order = torch.sort(scores, dim=-1, descending=True)
+    hits = labels.gather(-1, order).to(dtype=torch.double)
+    cumulative_hits = torch.cumsum(hits, dim=-1)
+    positions = torch.arange(
+        num_labels, device=scores.device, dtype=torch.long
+    ).expand_as(order)
+    precision = cumulative_hits / (positions + 1)
+    # index of the last element of the tie group of every element
+    is_group_end = torch.ones_like(order, dtype=torch.bool)
+    is_group_end[..., :-1] = sorted_scores[..., :-1] != sorted_scores[..., 1:]
+    group_end = torch.where(
+        is_group_end, positions, torch.full_like(positions, num_labels)
+    )
+    # the smallest group end on the right, using cummin on the reversed order
+    group_end = torch.flip(
+        torch.cummin(torch.flip(group_end, [-1]), dim=-1).values, [-1]
+    )
+
+    return torch.sum(
+        hits * precision.gather(-1, group_end), dim=-1
+    ) / cumulative_hits[..., -1].clamp_min(1)
+
+
 @Metric.register("multilabel-classification-mean-avg-precision")
-class MultilabelClassificationMeanAvgPrecision(Average):
+class MultilabelClassificationMeanAvgPrecision(Metric):
 
-    """Docstring for MeanAvgPrecision. """
+    """Mean over the examples of the average precision of every example.
+
+    The accumulation happens on the device of the predictions, so there
+    is no device to host copy until `get_metric` is called.
+    """
 
     def __init__(self) -> None:
         super().__init__()
+        self._total_value: Union[float, torch.Tensor] = 0.0
+        self._count = 0
 
     def __call__(self, predictions: torch.Tensor, gold_labels: torch.Tensor) -> None:  # type: ignore
-        labels, scores = [
-            t.cpu().numpy()
-            for t in self.detach_tensors(gold_labels, predictions)
-        ]
-
-        for single_example_labels, single_example_scores in zip(
-            labels, scores
-        ):
-            avg_precision = average_precision_score(
-                single_example_labels, single_example_scores
-            )
-            super().__call__(avg_precision)
+        scores, labels = self.detach_tensors(predictions, gold_labels)
+        avg_precision = average_precision(scores, labels)
+        self._total_value = self._total_value + torch.sum(avg_precision)
+        self._count = self._count + avg_precision.shape[0]
+
+    def get_metric(self, reset: bool) -> float:
+        if self._count > 0:
+            value = float(self._total_value) / self._count
+        else:
+            value = 0.0
+
+        if reset:
+            self.reset()
+
+        return value
+
+    def reset(self) -> None:
+        self._total_value = 0.0
+        self._count = 0
@@ -1,43 +1,140 @@
-"""Implements micro average precision using sklearn"""
+"""Implements micro average precision"""
 from typing import List, Tuple, Union, Dict, Any, Optional
 
-from sklearn.metrics import average_precision_score
-from allennlp.training.metrics import Metric, Average
+from allennlp.training.metrics import Metric
 import torch
 
 
+def average_precision_from_counts(
+    positives: torch.Tensor,  #: (num_thresholds,)
+    negatives: torch.Tensor,  #: (num_thresholds,)
+) -> float:
+    """
+    Average precision given the number of positive and negative examples
+    at every distinct threshold, with the thresholds sorted in descending order.
+    """
+    true_positives = torch.cumsum(positives, dim=0)
+    false_positives = torch.cumsum(negatives, dim=0)
+    predicted_positives = (true_positives + false_positives).clamp_min(1)
+    total_positives = true_positives[-1].clamp_min(1)
+
+    return float(
+        torch.sum(positives * true_positives / predicted_positives)
+        / total_positives
+    )
+
+
 @Metric.register("multilabel-classification-micro-avg-precision")
 class MultilabelClassificationMicroAvgPrecision(Metric):
 
-    """Docstring for MicroAvgPrecision."""
+    """Average precision over all (example, label) pairs, i.e., micro averaged.
+
+    Two modes are supported:
 
-    def __init__(self) -> None:
+        1. "exact": The scores and labels (as bool) are appended to a buffer on the cpu
+            which grows geometrically, so each batch costs O(batch*num_labels)
+            (no repeated concatenation). The buffer is sorted only in `get_metric`.
+            Memory is O(num_examples*num_labels).
+            The result is the same as `sklearn.metrics.average_precision_score(average="micro")`.
+
+        2. "binned": The scores, which should be in [0, 1], are bucketed into `num_bins`
+            equally spaced bins and only the number of positives and negatives per bin
+            are kept. Memory is O(num_bins) and all the scores in a bin are treated as tied.
+    """
+
+    modes = ("exact", "binned")
+
+    def __init__(self, mode: str = "exact", num_bins: int = 10000) -> None:
         super().__init__()
-        self.predicted = torch.Tensor([])
-        self.gold = torch.Tensor([])
+
+        if mode not in self.modes:
+            raise ValueError(f"mode should be one of {self.modes}")
+        self.mode = mode
+        self.num_bins = num_bins
+        self.reset()
 
     def __call__(self, predictions: torch.Tensor, gold_labels: torch.Tensor) -> None:  # type: ignore
         # predictions, gold_labels: (batch_size, labels)
-        predictions, gold_labels = [
-            t.cpu() for t in self.detach_tensors(predictions, gold_labels)
-        ]
-        self.predicted = torch.cat([self.predicted, predictions], dim=0)
-        self.gold = torch.cat([self.gold, gold_labels], dim=0)
+        predictions, gold_labels = self.detach_tensors(predictions, gold_labels)
+        scores = predictions.reshape(-1)
+        labels = gold_labels.reshape(-1)
 
-    def get_metric(self, reset: bool) -> float:
-        labels, scores = [
-            t.cpu().numpy()
-            for t in self.detach_tensors(self.gold, self.predicted)
-        ]
-        micro_precision_score = average_precision_score(
-            labels, scores, average="micro"
+        if self.mode == "binned":
+            self._update_bins(scores, labels.to(dtype=torch.double))
+        else:
+            # the labels are 0/1, keep them in one byte each until get_metric.
+            # The buffer grows with the epoch, so it is kept off the gpu.
+            self._append(scores.cpu(), labels.to(dtype=torch.bool).cpu())
+
+    def _update_bins(self, scores: torch.Tensor, labels: torch.Tensor) -> None:
+        bins = (
+            (scores.to(dtype=torch.double) * self.num_bins)
+            .long()
+            .clamp(0, self.num_bins - 1)
         )
 
+        if self._positives is None or self._negatives is None:
+            self._positives = torch.zeros(
+                self.num_bins, dtype=torch.double, device=scores.device
+            )
+            self._negatives = torch.zeros_like(self._positives)
+        self._positives.index_add_(0, bins, labels)
+        self._negatives.index_add_(0, bins, 1 - labels)
+
+    def _append(self, scores: torch.Tensor, labels: torch.Tensor) -> None:
+        end = self._size + scores.shape[0]
+
+        if self._scores is None or self._labels is None:
+            self._scores = scores.new_empty((max(end, 1024),))
+            self._labels = labels.new_empty((max(end, 1024),))
+        elif end > self._scores.shape[0]:
+            # grow geometrically to keep the copies amortized O(1) per element
+            capacity = max(end, 2 * self._scores.shape[0])
+            new_scores = self._scores.new_empty((capacity,))
+            new_labels = self._labels.new_empty((capacity,))
+            new_scores[: self._size] = self._scores[: self._size]
+            new_labels[: self._size] = self._labels[: self._size]
+            self._scores, self._labels = new_scores, new_labels
+        self._scores[self._size : end] = scores
+        self._labels[self._size : end] = labels
+        self._size = end
+
+    def get_metric(self, reset: bool) -> float:
+        if self.mode == "binned":
+            if self._positives is None or self._negatives is None:
+                micro_precision_score = 0.0
+            else:
+                # highest bin first
+                micro_precision_score = average_precision_from_counts(
+                    self._positives.flip(0), self._negatives.flip(0)
+                )
+        elif self._scores is None or self._labels is None or self._size == 0:
+            micro_precision_score = 0.0
+        else:
+            scores = self._scores[: self._size]
+            labels = self._labels[: self._size].to(dtype=torch.double)
+            # group the tied scores to get a threshold per distinct score
+            unique_scores, inverse = torch.unique(
+                scores, sorted=True, return_inverse=True
+            )
+            positives = torch.zeros(
+                unique_scores.shape[0], dtype=torch.double, device=scores.device
+            )
+            negatives = torch.zeros_like(positives)
+            positives.index_add_(0, inverse, labels)
+            negatives.index_add_(0, inverse, 1 - labels)
+            micro_precision_score = average_precision_from_counts(
+                positives.flip(0), negatives.flip(0)
+            )
+
         if reset:
             self.reset()
 
         return micro_precision_score
 
     def reset(self) -> None:
-        self.predicted = torch.Tensor([])
-        self.gold = torch.Tensor([])
+        self._positives: Optional[torch.Tensor] = None
+        self._negatives: Optional[torch.Tensor] = None
+        self._scores: Optional[torch.Tensor] = None
+        self._labels: Optional[torch.Tensor] = None
+        self._size = 0
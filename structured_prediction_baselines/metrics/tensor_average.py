@@ -0,0 +1,41 @@
+from typing import List, Tuple, Union, Dict, Any, Optional
+
+from allennlp.training.metrics import Metric
+import torch
+
+
+class TensorAverage(Metric):
+    """
+    Like allennlp's `Average`, but takes a tensor of values and keeps the running sum
+    on the device of the values, so that `__call__` does not need a device to host copy.
+    The only sync happens in `get_metric`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._total_value: Union[float, torch.Tensor] = 0.0
+        self._count = 0
+
+    def __call__(self, values: torch.Tensor) -> None:  # type: ignore
+        """
+        Args:
+            values: Tensor of shape (batch,) to be averaged.
+        """
+        (values,) = self.detach_tensors(values)
+        self._total_value = self._total_value + torch.sum(values)
+        self._count += values.numel()
+
+    def get_metric(self, reset: bool = False) -> float:
+        if self._count > 0:
+            average_value = float(self._total_value) / self._count
+        else:
+            average_value = 0.0
+
+        if reset:
+            self.reset()
+
+        return average_value
+
+    def reset(self) -> None:
+        self._total_value = 0.0
+        self._count = 0
@@ -2,6 +2,9 @@ from typing import List, Tuple, Union, Dict, Any, Optional
 import torch
 from allennlp.models import Model
 from structured_prediction_baselines.modules.sampler import Sampler
+from structured_prediction_baselines.modules.sampler.inference_net import (
+    NUM_FORWARDS_KEY,
+)
 from structured_prediction_baselines.modules.oracle_value_function import (
     OracleValueFunction,
 )
@@ -24,8 +27,17 @@ class ScoreBasedLearningModel(Model):
         inference_module: Optional[Sampler] = None,
         regularizer: Optional[RegularizerApplicator] = None,
         initializer: Optional[InitializerApplicator] = None,
+        training_metrics_every: int = 1,
         **kwargs: Any,
     ) -> None:
+        """
+        Args:
+            training_metrics_every: During training, update the metrics only every these many
+                batches. Set to 0 to not compute metrics during training at all.
+                The metrics are always computed in eval mode. On the batches without metrics,
+                the eval mode pass of the `inference_module` that produces the predictions
+                for the metrics is skipped as well, and `y_pred` is the output of the sampler.
+        """
         super().__init__(vocab, regularizer=regularizer)  # type:ignore
         self.sampler = sampler
         self.loss_fn = loss_fn
@@ -37,6 +49,15 @@ class ScoreBasedLearningModel(Model):
         else:
             self.inference_module = sampler
 
+        if training_metrics_every < 0:
+            raise ValueError("training_metrics_every cannot be negative")
+        self.training_metrics_every = training_metrics_every
+        self._num_training_batches = 0
+        # the last values returned by get_metrics and whether
+        # the metrics have been updated since.
+        self._cached_metrics: Optional[Dict[str, float]] = None
+        self._metrics_updated = False
+
         if initializer is not None:
             initializer(self)
 
@@ -51,6 +72,7 @@ class ScoreBasedLearningModel(Model):
         oracle_value_function: Optional[OracleValueFunction] = None,
         regularizer: Optional[RegularizerApplicator] = None,
         initializer: Optional[InitializerApplicator] = None,
+        training_metrics_every: int = 1,
         **kwargs: Any,
     ) -> "ScoreBasedLearningModel":
         
@@ -89,9 +111,50 @@ class ScoreBasedLearningModel(Model):
             inference_module=inference_module_,
             regularizer=regularizer,
             initializer=initializer,
+            training_metrics_every=training_metrics_every,
             **kwargs,
         )
 
+    def should_calculate_metrics(self) -> bool:
+        """Whether to update the metrics for the current batch.
+
+        The metrics keep their state on the device, hence skipping them
+        also skips the device to host syncs they might need.
+        """
+
+        if not self.training:
+            return True
+        self._num_training_batches += 1
+
+        if self.training_metrics_every == 0:
+            return False
+
+        return (
+            self._num_training_batches - 1
+        ) % self.training_metrics_every == 0
+
+    def compute_metrics(self, reset: bool = False) -> Dict[str, float]:
+        """Reads the values of all the metrics. Subclasses should override this
+        instead of `get_metrics`."""
+
+        return {}
+
+    def get_metrics(self, reset: bool = False) -> Dict[str, float]:
+        # The trainer asks for the metrics after every batch.
+        # If they have not changed, return the last values to avoid a device sync.
+
+        if (
+            not reset
+            and not self._metrics_updated
+            and self._cached_metrics is not None
+        ):
+            return dict(self._cached_metrics)
+        metrics = self.compute_metrics(reset)
+        self._metrics_updated = False
+        self._cached_metrics = None if reset else dict(metrics)
+
+        return metrics
+
     def calculate_metrics(
         self,
         labels: torch.Tensor,  # shape: (batch, ...)
@@ -144,7 +207,9 @@ class ScoreBasedLearningModel(Model):
 
         if labels is not None:
             labels = self.convert_to_one_hot(labels)
-            y_hat, y_hat_extra = self.sampler(x, labels, buffer=buffer)
+            y_hat, y_hat_extra = self.sampler(
+                x, labels, buffer=buffer, meta=meta
+            )
             # (batch, num_samples or 1, ...), (batch, num_samples or 1)
             # y_hat_extra could be y_cost_augmented, or probabilities for MRT type model, etc.
             results["y_hat"] = y_hat
@@ -154,8 +219,12 @@ class ScoreBasedLearningModel(Model):
             # y_pred is predictions for metric calculations
             # y_hat are for loss computation
             # For some models this two can be different
+            calculate_metrics = self.should_calculate_metrics()
 
-            if (self.sampler != self.inference_module) or (
+            if not calculate_metrics:
+                # the extra inference pass is only needed for the metrics
+                y_pred = y_hat
+            elif (self.sampler != self.inference_module) or (
                 self.inference_module.different_training_and_eval
             ):
                 # we have different sampler for training and inference
@@ -167,7 +236,7 @@ class ScoreBasedLearningModel(Model):
                 model_state = self.training
                 self.inference_module.eval()
                 y_pred, _ = self.inference_module(
-                    x, labels=None, buffer=buffer
+                    x, labels=None, buffer=buffer, meta=meta
                 )
                 self.inference_module.train(model_state)
             else:
@@ -182,16 +251,31 @@ class ScoreBasedLearningModel(Model):
                 buffer,
             )
             results["loss"] = loss
-            self.calculate_metrics(
-                self.squeeze_y(labels), self.squeeze_y(y_pred), buffer
-            )
+
+            if calculate_metrics:
+                self.calculate_metrics(
+                    self.squeeze_y(labels), self.squeeze_y(y_pred), buffer
+                )
+                self._metrics_updated = True
         else:
             # labels not present. Just predict.
             model_state = self.training
             self.inference_module.eval()
-            y_pred, _ = self.inference_module(x, labels=None, buffer=buffer)
+            y_pred, _ = self.inference_module(
+                x, labels=None, buffer=buffer, meta=meta
+            )
             self.inference_module.train(model_state)
 
         results["y_pred"] = y_pred
 
+        if NUM_FORWARDS_KEY in buffer:
+            # instrumentation: forward passes of the inference networks on this batch.
+            # Batch shaped so that the output can be split per instance.
+            results[NUM_FORWARDS_KEY] = torch.full(
+                (y_pred.shape[0],),
+                buffer[NUM_FORWARDS_KEY],
+                dtype=torch.long,
+                device=y_pred.device,
+            )
+
         return results
@@ -9,10 +9,9 @@ from structured_prediction_baselines.modules.loss import Loss
 from allennlp.data.vocabulary import Vocabulary
 from structured_prediction_baselines.modules.score_nn import ScoreNN
 from structured_prediction_baselines.metrics import (
-    MultilabelClassificationF1,
+    MultilabelClassificationFusedF1,
     MultilabelClassificationMeanAvgPrecision,
     MultilabelClassificationMicroAvgPrecision,
-    MultilabelClassificationRelaxedF1,
 )
 from allennlp.models import Model
 import logging
@@ -26,14 +25,27 @@ logger = logging.getLogger(__name__)
 class MultilabelClassification(ScoreBasedLearningModel):
     def __init__(
         self,
+        f1_sweep_thresholds: Optional[List[float]] = None,
+        micro_map_mode: str = "binned",
         **kwargs: Any,
     ) -> None:
+        """
+        Args:
+            f1_sweep_thresholds: If given, the fixed and macro F1 are also reported
+                at these thresholds, along with the best one among them.
+            micro_map_mode: "binned" (O(num_bins) memory) or "exact" (keeps all the
+                scores of the epoch). See :class:`MultilabelClassificationMicroAvgPrecision`.
+        """
         super().__init__(**kwargs)
         # metrics
-        self.f1 = MultilabelClassificationF1()
+        # fixed_f1, relaxed_f1 and macro_f1 in a single pass
+        self.f1 = MultilabelClassificationFusedF1(
+            sweep_thresholds=f1_sweep_thresholds or []
+        )
         self.map = MultilabelClassificationMeanAvgPrecision()
-        self.micro_map = MultilabelClassificationMicroAvgPrecision()
-        self.relaxed_f1 = MultilabelClassificationRelaxedF1()
+        self.micro_map = MultilabelClassificationMicroAvgPrecision(
+            mode=micro_map_mode
+        )
 
     def unsqueeze_labels(self, labels: torch.Tensor) -> torch.Tensor:
         """Unsqueeze and turn the labels into one-hot if required"""
@@ -53,21 +65,19 @@ class MultilabelClassification(ScoreBasedLearningModel):
     ) -> None:
 
         self.map(y_hat, labels)
-        self.micro_map(y_hat, labels)
 
         if not self.inference_module.is_normalized:
             y_hat_n = torch.sigmoid(y_hat)
         else:
             y_hat_n = y_hat
-
-        self.relaxed_f1(y_hat_n, labels)
+        # the bins of the binned mode are over [0, 1]
+        self.micro_map(y_hat_n, labels)
         self.f1(y_hat_n, labels)
 
-    def get_metrics(self, reset: bool = False) -> Dict[str, float]:
+    def compute_metrics(self, reset: bool = False) -> Dict[str, float]:
 
         return {
             "MAP": self.map.get_metric(reset),
-            "fixed_f1": self.f1.get_metric(reset),
             "micro_map": self.micro_map.get_metric(reset),
-            "relaxed_f1": self.relaxed_f1.get_metric(reset),
+            **self.f1.get_metric(reset),
         }
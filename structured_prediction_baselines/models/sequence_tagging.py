@@ -90,7 +90,7 @@ class SequenceTagging(ScoreBasedLearningModel):
         labels_indices = torch.argmax(labels, dim=-1)
         self._f1_metric(y_hat, labels_indices, mask)
 
-    def get_metrics(self, reset: bool = False) -> Dict[str, float]:
+    def compute_metrics(self, reset: bool = False) -> Dict[str, float]:
         f1_dict = self._f1_metric.get_metric(reset=reset)
 
         return {x: y for x, y in f1_dict.items() if "overall" in x}
@@ -2,6 +2,7 @@ from typing import Optional, Tuple
 
 from overrides import overrides
 import torch
+import torch.nn.functional as F
 from torch.nn import Conv2d, Linear, Dropout
 
 from allennlp.modules.seq2vec_encoders.seq2vec_encoder import Seq2VecEncoder
@@ -60,6 +61,11 @@ class Cnn2dEncoder(Seq2VecEncoder):
         ]
         for i, conv_layer in enumerate(self._convolution_layers):
             self.add_module("conv_layer_%d" % i, conv_layer)
+        # all the convolutions produce the same number of positions iff
+        # the filter sizes have the same parity. In that case they can be packed into one.
+        self._packable = len({k % 2 for k in self._ngram_filter_sizes}) == 1
+        self._packed_parameters_key: Optional[Tuple] = None
+        self._packed_parameters: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
 
         self._dropout = Dropout(dropout)
 
@@ -71,11 +77,109 @@ class Cnn2dEncoder(Seq2VecEncoder):
     def get_output_dim(self) -> int:
         return self._output_dim
 
+    def packed_parameters(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Stacks the filters of all the convolution layers into one `conv1d` filter.
+
+        A (ngram_size, num_tags) filter over a single channel is the same as a 1D filter of
+        width ngram_size over num_tags channels. The filters of all the layers are zero padded
+        (centered) to the largest ngram size and stacked.
+
+        Packing copies the filters. When they do not need grad, like during gradient based
+        inference where the encoder is called once per step, the packed filters are kept and
+        only rebuilt when a parameter is changed (in place or by moving the module).
+
+        # Returns
+
+        weight of shape (num_filters * num_conv_layers, num_tags, max_size)
+        and bias of shape (num_filters * num_conv_layers,)
+        """
+        layers = [
+            getattr(self, "conv_layer_{}".format(i))
+            for i in range(len(self._convolution_layers))
+        ]
+        parameters = [p for layer in layers for p in (layer.weight, layer.bias)]
+        cacheable = not (
+            torch.is_grad_enabled() and any(p.requires_grad for p in parameters)
+        )
+        key = (torch.is_inference_mode_enabled(),) + tuple(
+            (p.data_ptr(), p._version) for p in parameters
+        )
+
+        if cacheable and self._packed_parameters_key == key:
+            return self._packed_parameters
+        max_size = max(self._ngram_filter_sizes)
+        weights = []
+
+        for layer in layers:
+            ngram_size = layer.kernel_size[0]
+            offset = max_size // 2 - ngram_size // 2
+            # (num_filters, 1, ngram_size, num_tags) -> (num_filters, num_tags, max_size)
+            weight = layer.weight.squeeze(1).transpose(1, 2)
+
+            if ngram_size < max_size:
+                weight = F.pad(weight, (offset, max_size - ngram_size - offset))
+            weights.append(weight)
+
+        if len(layers) > 1:
+            packed = (
+                torch.cat(weights, dim=0),
+                torch.cat([layer.bias for layer in layers], dim=0),
+            )
+        else:
+            packed = (weights[0].contiguous(), layers[0].bias)
+
+        if cacheable:
+            self._packed_parameters_key = key
+            self._packed_parameters = packed
+        else:
+            self._packed_parameters_key = None
+            self._packed_parameters = None
+
+        return packed
+
+    def packed_convolution(self, tokens: torch.Tensor) -> torch.Tensor:
+        """
+        Runs all the convolution layers as one `conv1d` with the tags as channels,
+        so that the output is the same as concatenating the outputs of the layers,
+        without a separate launch per layer.
+
+        # Parameters
+
+        tokens : `torch.Tensor`
+            Shape (batch_size * n_samples, seq_length, num_tags)
+
+        # Returns
+
+        Tensor of shape (batch_size * n_samples, num_filters * num_conv_layers, pool_length)
+        """
+        weight, bias = self.packed_parameters()
+
+        return F.conv1d(
+            tokens.transpose(1, 2),
+            weight,
+            bias,
+            padding=max(self._ngram_filter_sizes) // 2,
+        )
+
     def forward(self, tokens: torch.Tensor, mask: torch.BoolTensor = None):
         if mask is not None:
             tokens = tokens * mask.unsqueeze(1).unsqueeze(-1)
 
         batch_size, n_samples, seq_length, _ = tokens.shape
+
+        if self._packable:
+            # The activation is applied to every filter before the score reduces them,
+            # so this output is materialized once.
+            # shape: (batch_size * n_samples, num_filters * num_conv_layers, pool_length)
+            output = self._activation(
+                self.packed_convolution(
+                    tokens.reshape((batch_size * n_samples, seq_length, -1))
+                )
+            )
+            output = self._dropout(output)
+
+            return output.view(batch_size, n_samples, seq_length, -1)
         tokens = tokens.reshape((batch_size*n_samples, 1, seq_length, -1))
         # input(tokens) shape: (batch_size, n_samples, seq_length, num_tags), we need to reshape and add a dimension to
         # match the dimensions that our convolution layer expects (N, in_channels, seq_length, num_tags)
@@ -72,7 +72,7 @@ class DVNLoss(Loss):
         # do the normalization based on the task
 
         if self.normalize_y:
-            y_hat = self.normalize(y_hat)
+            y_hat = self.normalized(y_hat, buffer)
         predicted_score = self.score_nn(
             x, y_hat, buffer, **kwargs
         )  # (batch, num_samples)
@@ -152,8 +152,8 @@ class DVNLossCostAugNet(Loss):
         # do the normalization based on the task
 
         if self.normalize_y:
-            y_hat = self.normalize(y_hat)
-            y_hat_extra = self.normalize(y_hat_extra)
+            y_hat = self.normalized(y_hat, buffer)
+            y_hat_extra = self.normalized(y_hat_extra, buffer)
         
         predicted_score = self.score_nn(
             x, y_hat, buffer, **kwargs
@@ -239,7 +239,7 @@ class DVNScoreLoss(Loss):
         # do the normalization based on the task
 
         if self.normalize_y:
-            y_hat = self.normalize(y_hat)
+            y_hat = self.normalized(y_hat, buffer)
 
         predicted_score = self.score_nn(
             x, y_hat, buffer, **kwargs
@@ -306,7 +306,7 @@ class DVNScoreCostAugNet(Loss):
         # do the normalization based on the task
 
         if self.normalize_y:
-            y_hat = self.normalize(y_hat)
+            y_hat = self.normalized(y_hat, buffer)
 
         predicted_score_infnet = self.score_nn(
             x, y_hat, buffer, **kwargs
@@ -151,13 +151,15 @@ class MarginBasedLoss(Loss):
 
         if y_cost_aug is None:
             y_cost_aug = (
-                y_hat if not self.normalize_y else self.normalize(y_hat)
+                y_hat
+                if not self.normalize_y
+                else self.normalized(y_hat, buffer)
             )
         elif self.normalize_y:  # y_cost_aug is not None
-            y_cost_aug = self.normalize(y_cost_aug)
+            y_cost_aug = self.normalized(y_cost_aug, buffer)
 
         if self.normalize_y:
-            y_hat = self.normalize(y_hat)
+            y_hat = self.normalized(y_hat, buffer)
         ground_truth_score = self.score_nn(
             x, labels.to(dtype=y_hat.dtype), buffer
         )
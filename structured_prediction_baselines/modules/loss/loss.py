@@ -1,5 +1,6 @@
-from typing import List, Tuple, Union, Dict, Any, Optional
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterator
 from allennlp.common.registrable import Registrable
+import contextlib
 import torch
 from structured_prediction_baselines.modules.score_nn import ScoreNN
 from structured_prediction_baselines.modules.oracle_value_function import (
@@ -16,6 +17,9 @@ class Loss(torch.nn.Module, Registrable):
 
     allowed_reductions = ["sum", "mean", "none"]
 
+    #: Key in the buffer under which the tensors registered by `shared_normalization()` are kept.
+    normalized_y_key: str = "normalized_y"
+
     def __init__(
         self,
         score_nn: Optional[ScoreNN] = None,
@@ -72,6 +76,42 @@ class Loss(torch.nn.Module, Registrable):
         """ To normalize y based on the task."""
         raise NotImplementedError
 
+    def normalized(self, y: torch.Tensor, buffer: Dict) -> torch.Tensor:
+        """
+        Same as `normalize(y)`, except that if a normalized tensor was registered for y
+        (the same object) using `shared_normalization()`, that tensor is returned.
+        Losses that score normalized y should use this, so that the score_nn
+        finds the scores precomputed for it (see :meth:`ScoreNN.precomputed_scores`).
+        """
+
+        for y_, y_normalized in buffer.get(self.normalized_y_key, ()):
+            if y_ is y:
+                return y_normalized
+
+        return self.normalize(y)
+
+    @classmethod
+    @contextlib.contextmanager
+    def shared_normalization(
+        cls,
+        pairs: List[Tuple[Optional[torch.Tensor], Optional[torch.Tensor]]],
+        buffer: Dict,
+    ) -> Iterator[None]:
+        """
+        Within the context, `normalized(y)` returns `y_normalized` for every `(y, y_normalized)`
+        in `pairs`. As the normalization only depends on the task, `y_normalized` has to be the
+        normalization of y used by all the losses for the task. Pairs with None are ignored.
+        """
+        buffer[cls.normalized_y_key] = [
+            (y, y_normalized)
+            for y, y_normalized in pairs
+            if y is not None and y_normalized is not None
+        ]
+        try:
+            yield
+        finally:
+            buffer.pop(cls.normalized_y_key, None)
+
     def _forward(
         self,
         x: Any,
@@ -5,6 +5,8 @@ import torch
 
 @ScoreNN.register("multi-label-classification")
 class MultilabelClassificationScoreNN(ScoreNN):
+    caches_x_encoding = True
+
     def compute_local_score(
         self,
         x: torch.Tensor,  #: (batch, features_size)
@@ -12,7 +14,7 @@ class MultilabelClassificationScoreNN(ScoreNN):
         buffer: Dict,
         **kwargs: Any,
     ) -> Optional[torch.Tensor]:
-        label_scores = self.task_nn(
+        label_scores = self.get_x_encoding(
             x, buffer
         )  # unormalized logit of shape (batch, num_labels)
         local_energy = torch.sum(
@@ -15,10 +15,23 @@ class MultilabelTaskNN(TaskNN):
         vocab: Vocabulary,
         feature_network: FeedForward,
         label_embeddings: Embedding,
+        input_dim: Optional[int] = None,
     ):
+        """
+        Args:
+            input_dim: If given, x of this dim is first projected to the input dim of the
+                feature_network by a linear layer of this module. Use it with sparse
+                features, for which the projection is computed using a sparse matmul.
+                Without it, sparse x is made dense before the feature_network.
+        """
         super().__init__()  # type:ignore
         self.feature_network = feature_network
         self.label_embeddings = label_embeddings
+        self.input_projection: Optional[nn.Linear] = (
+            nn.Linear(input_dim, feature_network.get_input_dim())
+            if input_dim is not None
+            else None
+        )
         assert (
             self.label_embeddings.weight.shape[1]
             == self.feature_network.get_output_dim()
@@ -28,13 +41,29 @@ class MultilabelTaskNN(TaskNN):
             f" ({self.feature_network.get_output_dim()}) do not match."
         )
 
+    def compute_features(self, x: torch.Tensor) -> torch.Tensor:
+        """Runs the input_projection, if any, and the feature_network."""
+
+        if self.input_projection is not None:
+            if x.is_sparse:
+                x = (
+                    torch.sparse.mm(x, self.input_projection.weight.T)
+                    + self.input_projection.bias
+                )
+            else:
+                x = self.input_projection(x)
+        elif x.is_sparse:
+            x = x.to_dense()
+
+        return self.feature_network(x)
+
     def forward(
         self,
         x: torch.Tensor,
         buffer: Dict,
         **kwargs: Any,
     ) -> torch.Tensor:
-        features = self.feature_network(x)  # (batch, hidden_dim)
+        features = self.compute_features(x)  # (batch, hidden_dim)
         logits = torch.matmul(features, self.label_embeddings.weight.T)
 
         return logits  # unormalized logit of shape (batch, num_labels)
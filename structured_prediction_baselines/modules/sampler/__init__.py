@@ -1,4 +1,6 @@
 from .sampler import Sampler
+from .sampling_strategy import SamplingStrategy
 from .infnet_multisample_backprop import InfnetMultiSampleLearner
 from .gradient_based_inference import GradientBasedInferenceSampler
 from .ground_truth_sampler import GroundTruthSampler
+from .warm_start_cache import WarmStartCache
@@ -11,9 +11,13 @@ from typing import (
 from types import ModuleType
 from structured_prediction_baselines.modules.sampler import Sampler
 from structured_prediction_baselines.modules.stopping_criteria import (
+    PerInstanceStoppingCriteria,
     StopAfterNumberOfSteps,
     StoppingCriteria,
 )
+from structured_prediction_baselines.modules.sampler.warm_start_cache import (
+    WarmStartCache,
+)
 from structured_prediction_baselines.modules.task_nn import TaskNN
 import torch
 from structured_prediction_baselines.modules.score_nn import ScoreNN
@@ -57,6 +61,137 @@ def disable_log(
             logging.getLogger(name).setLevel(level)
 
 
+def index_batch(obj: Any, index: torch.Tensor, batch_size: int) -> Any:
+    """Selects the rows `index` from every tensor in `obj` whose first dim is the batch.
+
+    `obj` can be a tensor or a (nested) dictionary of tensors like
+    `TextFieldTensors` or the `buffer`. Everything else is returned as is.
+    """
+
+    if isinstance(obj, torch.Tensor):
+        if obj.dim() > 0 and obj.shape[0] == batch_size:
+            return obj.index_select(0, index)
+
+        return obj
+
+    if isinstance(obj, dict):
+        return {
+            key: index_batch(value, index, batch_size)
+            for key, value in obj.items()
+        }
+
+    return obj
+
+
+class SampleAccumulator:
+    """
+    Receives the trajectory of gradient descent one step at a time and
+    keeps only what is needed to produce the samples.
+
+    The loops call `append_point` with the initial point, and then on every step,
+    `append_loss` with the (unreduced) loss at the last appended point followed by
+    `append_point` with the new point. The tensors passed are updated in-place by
+    the loop afterwards, so an accumulator has to copy whatever it keeps.
+    """
+
+    def __init__(self) -> None:
+        self.last_point: Optional[torch.Tensor] = None
+
+    def append_point(
+        self, point: torch.Tensor  #: (batch, num_init_samples, ...)
+    ) -> None:
+        self.last_point = point
+
+    def append_loss(
+        self, loss_values_tensor: torch.Tensor  #: (batch, num_init_samples)
+    ) -> None:
+        raise NotImplementedError
+
+    def pick(
+        self, loss_values: List[float]
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        """
+        Returns:
+            samples: List[Tensor(batch, num_samples, ...)]
+            loss_values_tensors: List[Tensor(batch, num_samples)]
+        """
+        raise NotImplementedError
+
+
+class TrajectoryAccumulator(SampleAccumulator):
+    """
+    Keeps the complete trajectory.
+
+    If the number of steps is known upfront, the trajectory is written into
+    preallocated buffers. If a `sample_picker` is given, `pick` applies it
+    to the complete trajectory, else the complete trajectory is returned.
+    """
+
+    def __init__(
+        self,
+        sample_picker: Optional["SamplePicker"] = None,
+        num_steps: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+        self.sample_picker = sample_picker
+        self.num_steps = num_steps
+        self.trajectory: List[torch.Tensor] = []
+        self.loss_values_tensors: List[torch.Tensor] = []
+        self._trajectory_buffer: Optional[torch.Tensor] = None
+        self._loss_buffer: Optional[torch.Tensor] = None
+        self._num_points = 0
+        self._num_losses = 0
+
+    def append_point(self, point: torch.Tensor) -> None:
+        super().append_point(point)
+
+        if self.num_steps is None:
+            self.trajectory.append(point.detach().clone())
+        else:
+            if self._trajectory_buffer is None:
+                self._trajectory_buffer = point.new_empty(
+                    (self.num_steps + 1, *point.shape)
+                )
+            self._trajectory_buffer[self._num_points].copy_(point.detach())
+        self._num_points += 1
+
+    def append_loss(self, loss_values_tensor: torch.Tensor) -> None:
+        if self.num_steps is None:
+            self.loss_values_tensors.append(
+                loss_values_tensor.detach().clone()
+            )
+        else:
+            if self._loss_buffer is None:
+                self._loss_buffer = loss_values_tensor.new_empty(
+                    (self.num_steps, *loss_values_tensor.shape)
+                )
+            self._loss_buffer[self._num_losses].copy_(
+                loss_values_tensor.detach()
+            )
+        self._num_losses += 1
+
+    def pick(
+        self, loss_values: List[float]
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        trajectory = self.trajectory
+        loss_values_tensors = self.loss_values_tensors
+
+        if self._trajectory_buffer is not None:
+            trajectory = list(
+                self._trajectory_buffer[: self._num_points].unbind(0)
+            )
+
+        if self._loss_buffer is not None:
+            loss_values_tensors = list(
+                self._loss_buffer[: self._num_losses].unbind(0)
+            )
+
+        if self.sample_picker is None:
+            return trajectory, loss_values_tensors
+
+        return self.sample_picker(trajectory, loss_values_tensors, loss_values)
+
+
 class GradientDescentLoop(Registrable):
     """
     Performs gradient descent w.r.t input tensor
@@ -123,12 +258,29 @@ class GradientDescentLoop(Registrable):
             int, Callable[[int, float], bool]
         ],  #: (current_step, current_loss)
         projection_function_: Callable[[torch.Tensor], None],
+        accumulator: Optional[SampleAccumulator] = None,
     ) -> Tuple[List[torch.Tensor], List[torch.Tensor], List[float]]:
+        """
+        Returns:
+            samples: The points of the trajectory kept by the `accumulator`.
+                The complete trajectory if no `accumulator` is given.
+            loss_values_tensors: The unreduced losses for the kept points.
+            loss_values: The total loss at every step of the trajectory.
+        """
+
+        if isinstance(stop, PerInstanceStoppingCriteria):
+            return self.active_set_descent(
+                initial_input,
+                loss_fn,
+                stop,
+                projection_function_,
+                accumulator=accumulator,
+            )
         initial_input.requires_grad = True
         inp = initial_input
-        trajectory: List[torch.Tensor] = [inp.detach().clone()]
+        accumulator = accumulator or TrajectoryAccumulator()
+        accumulator.append_point(inp.detach())
         loss_values: List[float] = []
-        loss_values_tensors: List[torch.Tensor] = []
         step_number = 0
         loss_value: Union[torch.Tensor, float] = float("inf")
 
@@ -145,25 +297,228 @@ class GradientDescentLoop(Registrable):
                         inp, loss_fn
                     )
                     projection_function_(inp)
-                    trajectory.append(inp.detach().clone())
+                    accumulator.append_loss(loss_values_tensor.detach())
+                    accumulator.append_point(inp.detach())
                     loss_values.append(float(loss_value))
-                    loss_values_tensors.append(
-                        loss_values_tensor.detach().clone()
-                    )
                     step_number += 1
             inp.requires_grad = False
         with torch.no_grad():  # type: ignore
             loss_values.append(float(torch.sum(loss_fn(inp))))
 
-        return trajectory, loss_values_tensors, loss_values
+        return (*accumulator.pick(loss_values), loss_values)
+
+    def active_set_descent(
+        self,
+        initial_input: torch.Tensor,
+        loss_fn: Callable[..., torch.Tensor],
+        stop: PerInstanceStoppingCriteria,
+        projection_function_: Callable[[torch.Tensor], None],
+        accumulator: Optional[SampleAccumulator] = None,
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor], List[float]]:
+        """
+        Gradient descent where every `(batch, num_init_samples)` row stops on its own.
+
+        Only the batch rows which have at least one unconverged sample are passed
+        to `loss_fn`, as `loss_fn(inp[active], active)`. When all the rows are active,
+        `loss_fn(inp, None)` is called. The converged samples are kept fixed
+        and their last loss is repeated in the returned loss tensors.
+        """
+        initial_input.requires_grad = True
+        inp = initial_input
+        batch_size = inp.shape[0]
+        accumulator = accumulator or TrajectoryAccumulator()
+        accumulator.append_point(inp.detach())
+        loss_sums: List[torch.Tensor] = []
+        converged = torch.zeros(
+            inp.shape[:2], dtype=torch.bool, device=inp.device
+        )  # (batch, num_init_samples)
+        converged_view_shape = inp.shape[:2] + (1,) * (inp.dim() - 2)
+        previous_loss: Optional[torch.Tensor] = None
+        active = torch.arange(batch_size, device=inp.device)
+        step_number = 0
+
+        with torch.enable_grad():
+            with self.input(inp):
+                while (not stop(step_number, float("inf"))) and len(
+                    active
+                ) > 0:
+                    if len(active) == batch_size:
+                        loss_active = loss_fn(inp, None)
+                        (grad,) = torch.autograd.grad(
+                            torch.sum(loss_active), inp
+                        )
+                        loss_unreduced = loss_active.detach()
+                    else:
+                        assert previous_loss is not None
+                        inp_active = (
+                            inp.detach().index_select(0, active).requires_grad_()
+                        )
+                        loss_active = loss_fn(inp_active, active)
+                        (grad_active,) = torch.autograd.grad(
+                            torch.sum(loss_active), inp_active
+                        )
+                        loss_unreduced = previous_loss.index_copy(
+                            0, active, loss_active.detach()
+                        )
+                        grad = torch.zeros_like(inp).index_copy_(
+                            0, active, grad_active
+                        )
+                    frozen = inp.detach().clone()
+                    inp.grad = grad
+                    assert self.active_optimizer is not None
+                    self.active_optimizer.step()
+                    projection_function_(inp)
+                    # rows that converge at this step do not take it
+                    converged |= stop.converged(
+                        loss_unreduced, previous_loss, inp.detach() - frozen
+                    )
+                    with torch.no_grad():
+                        inp.copy_(
+                            torch.where(
+                                converged.view(converged_view_shape),
+                                frozen,
+                                inp,
+                            )
+                        )
+                    accumulator.append_loss(loss_unreduced)
+                    accumulator.append_point(inp.detach())
+                    loss_sums.append(torch.sum(loss_unreduced))
+                    previous_loss = loss_unreduced
+                    step_number += 1
+                    active = torch.nonzero(
+                        ~converged.all(dim=1), as_tuple=True
+                    )[0]
+            inp.requires_grad = False
+        with torch.no_grad():  # type: ignore
+            loss_sums.append(torch.sum(loss_fn(inp, None)))
+        loss_values: List[float] = torch.stack(loss_sums).tolist()
+
+        return (*accumulator.pick(loss_values), loss_values)
 
 
 GradientDescentLoop.register("basic")(GradientDescentLoop)
 
 
+@GradientDescentLoop.register("fused")
+class FusedGradientDescentLoop(GradientDescentLoop):
+    """
+    Performs the same updates as the `basic` loop but with less overhead per step.
+
+    1. The gradient is taken using `torch.autograd.grad` w.r.t the input only
+        and handed to the optimizer, which updates the input and its own state in-place.
+    2. If the number of steps is known upfront, the trajectory and the per-step
+        losses are written into preallocated buffers instead of cloning every step.
+    3. The losses stay on the device. Criteria that do not look at the loss
+        (`requires_loss_value=False`) never cause a sync inside the loop. The others
+        are consulted with the current loss (a host sync) every `check_stopping_every`
+        steps. The default of 1 stops at the same step as the `basic` loop. Larger
+        values sync less often but can take up to `check_stopping_every - 1` steps
+        more than `basic` (even past a step limit checked by the criteria),
+        and criteria that keep state between calls only see every few losses.
+    """
+
+    def __init__(
+        self, optimizer: Lazy[Optimizer], check_stopping_every: int = 1
+    ):
+        super().__init__(optimizer)
+
+        if check_stopping_every < 1:
+            raise ValueError("check_stopping_every should be >= 1")
+        self.check_stopping_every = check_stopping_every
+
+    def update(
+        self,
+        inp: torch.Tensor,
+        loss_fn: Callable[[torch.Tensor], torch.Tensor],
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        assert (
+            inp.requires_grad
+        ), "Input to step should have requires_grad=True"
+        loss_unreduced = loss_fn(inp)
+        loss = torch.sum(loss_unreduced)
+        (inp.grad,) = torch.autograd.grad(loss, inp)
+        assert self.active_optimizer is not None
+        self.active_optimizer.step()  # this will update `inp`
+
+        return inp, loss_unreduced, loss
+
+    def __call__(
+        self,
+        initial_input: torch.Tensor,
+        loss_fn: Callable[[torch.Tensor], torch.Tensor],
+        stop: Union[
+            int, Callable[[int, float], bool]
+        ],  #: (current_step, current_loss)
+        projection_function_: Callable[[torch.Tensor], None],
+        accumulator: Optional[SampleAccumulator] = None,
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor], List[float]]:
+        if isinstance(stop, int):
+            stop = StopAfterNumberOfSteps(stop)
+
+        if isinstance(stop, PerInstanceStoppingCriteria):
+            return self.active_set_descent(
+                initial_input,
+                loss_fn,
+                stop,
+                projection_function_,
+                accumulator=accumulator,
+            )
+        requires_loss_value = getattr(stop, "requires_loss_value", True)
+
+        if accumulator is None:
+            accumulator = TrajectoryAccumulator(
+                num_steps=None
+                if requires_loss_value
+                else getattr(stop, "number_of_steps", None)
+            )
+        initial_input.requires_grad = True
+        inp = initial_input
+        accumulator.append_point(inp.detach())
+        loss_sums: List[torch.Tensor] = []
+        step_number = 0
+        should_stop = stop(step_number, float("inf"))
+
+        with torch.enable_grad():
+            with self.input(inp):
+                while not should_stop:
+                    inp, loss_values_tensor, loss_value = self.update(
+                        inp, loss_fn
+                    )
+                    projection_function_(inp)
+                    accumulator.append_loss(loss_values_tensor.detach())
+                    accumulator.append_point(inp.detach())
+                    loss_sums.append(loss_value.detach())
+                    step_number += 1
+
+                    if not requires_loss_value:
+                        should_stop = stop(step_number, float("inf"))
+                    elif step_number % self.check_stopping_every == 0:
+                        should_stop = stop(step_number, float(loss_value))
+            inp.requires_grad = False
+        with torch.no_grad():  # type: ignore
+            loss_sums.append(torch.sum(loss_fn(inp)))
+        # single sync for all the loss values
+        loss_values: List[float] = torch.stack(loss_sums).tolist()
+
+        return (*accumulator.pick(loss_values), loss_values)
+
+
 class SamplePicker(Registrable):
     default_implementation = "lastn"
 
+    def accumulator(self, num_steps: Optional[int] = None) -> SampleAccumulator:
+        """
+        Returns a fresh accumulator that the gradient descent loop feeds every step.
+
+        Args:
+            num_steps: The exact number of steps that the loop will take, if known.
+
+        The default keeps the complete trajectory and calls the picker at the end.
+        Pickers override this to keep only what they need.
+        """
+
+        return TrajectoryAccumulator(self, num_steps=num_steps)
+
     def __call__(
         self,
         trajectory: List[torch.Tensor],
@@ -173,6 +528,55 @@ class SamplePicker(Registrable):
         raise NotImplementedError
 
 
+class LastNAccumulator(SampleAccumulator):
+    """Ring buffers holding the last `n` points and the last `n` losses."""
+
+    def __init__(self, n: int) -> None:
+        super().__init__()
+        assert n > 0
+        self.n = n
+        self._points: Optional[torch.Tensor] = None
+        self._losses: Optional[torch.Tensor] = None
+        self._num_points = 0
+        self._num_losses = 0
+
+    def append_point(self, point: torch.Tensor) -> None:
+        super().append_point(point)
+
+        if self._points is None:
+            self._points = point.new_empty((self.n, *point.shape))
+        self._points[self._num_points % self.n].copy_(point.detach())
+        self._num_points += 1
+
+    def append_loss(self, loss_values_tensor: torch.Tensor) -> None:
+        if self._losses is None:
+            self._losses = loss_values_tensor.new_empty(
+                (self.n, *loss_values_tensor.shape)
+            )
+        self._losses[self._num_losses % self.n].copy_(
+            loss_values_tensor.detach()
+        )
+        self._num_losses += 1
+
+    @staticmethod
+    def _in_order(buffer: Optional[torch.Tensor], count: int) -> List[torch.Tensor]:
+        if buffer is None:
+            return []
+        n = len(buffer)
+
+        return [
+            buffer[i % n] for i in range(max(0, count - n), count)
+        ]  # oldest to newest
+
+    def pick(
+        self, loss_values: List[float]
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        return (
+            self._in_order(self._points, self._num_points),
+            self._in_order(self._losses, self._num_losses),
+        )
+
+
 @SamplePicker.register("lastn")
 class LastNSamplePicker(SamplePicker):
     """
@@ -182,6 +586,16 @@ class LastNSamplePicker(SamplePicker):
     def __init__(self, fraction_of_samples_to_keep: float = 1.0):
         self.fraction_of_samples_to_keep = fraction_of_samples_to_keep
 
+    def accumulator(self, num_steps: Optional[int] = None) -> SampleAccumulator:
+        if num_steps is not None:
+            # trajectory has num_steps+1 points
+            n = int((num_steps + 1) * self.fraction_of_samples_to_keep)
+
+            if n > 0:
+                return LastNAccumulator(n)
+
+        return super().accumulator(num_steps)
+
     @torch.no_grad()
     def __call__(
         self,
@@ -201,8 +615,63 @@ class LastNSamplePicker(SamplePicker):
         return trajectory[cutoff_index:], loss_values_tensors[cutoff_index:]
 
 
+class BestAccumulator(SampleAccumulator):
+    """Keeps the running best sample for each item in the batch."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending: Optional[torch.Tensor] = None
+        self._best_samples: Optional[torch.Tensor] = None  # (batch, ...)
+        self._best_losses: Optional[torch.Tensor] = None  # (batch,)
+
+    def append_point(self, point: torch.Tensor) -> None:
+        super().append_point(point)
+
+        if self._pending is None:
+            self._pending = point.detach().clone()
+        else:
+            self._pending.copy_(point.detach())
+
+    @torch.no_grad()
+    def append_loss(self, loss_values_tensor: torch.Tensor) -> None:
+        assert self._pending is not None
+        # best over all the initializations for the pending point
+        losses, indices = torch.min(
+            loss_values_tensor, dim=1, keepdim=False
+        )  # (batch,)
+        samples = self._pending[
+            torch.arange(len(indices), device=indices.device), indices, ...
+        ]  # (batch, ...)
+
+        if self._best_losses is None:
+            self._best_losses = losses.clone()
+            self._best_samples = samples
+        else:
+            assert self._best_samples is not None
+            # strict inequality keeps the earliest best, like torch.min does
+            better = losses < self._best_losses
+            self._best_losses = torch.where(better, losses, self._best_losses)
+            self._best_samples = torch.where(
+                better.view(-1, *([1] * (samples.dim() - 1))),
+                samples,
+                self._best_samples,
+            )
+
+    def pick(
+        self, loss_values: List[float]
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        assert (
+            self._best_samples is not None and self._best_losses is not None
+        ), "At least one step is needed to pick the best sample"
+
+        return [self._best_samples.unsqueeze(1)], [self._best_losses]
+
+
 @SamplePicker.register("best")
 class BestSamplePicker(SamplePicker):
+    def accumulator(self, num_steps: Optional[int] = None) -> SampleAccumulator:
+        return BestAccumulator()
+
     @torch.no_grad()
     def __call__(
         self,
@@ -249,8 +718,23 @@ class GradientBasedInferenceSampler(Sampler):
         sample_picker: SamplePicker = None,
         number_init_samples: int = 1,
         random_mixing_in_init: float = 0.5,
+        warm_start_cache: Optional[WarmStartCache] = None,
+        warm_start_stopping_criteria: Optional[
+            Union[int, StoppingCriteria]
+        ] = None,
+        warm_start_in_eval: bool = False,
         **kwargs: Any,
     ):
+        """
+        Args:
+            warm_start_cache: If given, the last solution for every instance (identified by
+                the `idx` in its `meta`) is stored and used as the initialization
+                the next time the instance is seen.
+            warm_start_stopping_criteria: Used instead of `stopping_criteria` when
+                all the instances in the batch are initialized from the `warm_start_cache`.
+            warm_start_in_eval: Use the `warm_start_cache` in eval mode as well.
+                Make sure that the ids of the instances across validation and test data differ.
+        """
         super().__init__(
             score_nn,
             oracle_value_function,
@@ -263,6 +747,9 @@ class GradientBasedInferenceSampler(Sampler):
         self.output_space = output_space
         self.number_init_samples = number_init_samples
         self.random_mixing_in_init = random_mixing_in_init
+        self.warm_start_cache = warm_start_cache
+        self.warm_start_stopping_criteria = warm_start_stopping_criteria
+        self.warm_start_in_eval = warm_start_in_eval
         self._different_training_and_eval = True
 
     @classmethod
@@ -277,6 +764,11 @@ class GradientBasedInferenceSampler(Sampler):
         sample_picker: SamplePicker = None,
         number_init_samples: int = 1,
         random_mixing_in_init: float = 0.5,
+        warm_start_cache: Optional[WarmStartCache] = None,
+        warm_start_stopping_criteria: Optional[
+            Union[int, StoppingCriteria]
+        ] = None,
+        warm_start_in_eval: bool = False,
     ) -> "GradientBasedInferenceSampler":
         loss_fn_ = loss_fn.construct(
             score_nn=score_nn, oracle_value_function=oracle_value_function
@@ -292,6 +784,9 @@ class GradientBasedInferenceSampler(Sampler):
             sample_picker=sample_picker,
             number_init_samples=number_init_samples,
             random_mixing_in_init=random_mixing_in_init,
+            warm_start_cache=warm_start_cache,
+            warm_start_stopping_criteria=warm_start_stopping_criteria,
+            warm_start_in_eval=warm_start_in_eval,
         )
 
     def get_loss_fn(
@@ -299,7 +794,14 @@ class GradientBasedInferenceSampler(Sampler):
         x: Any,
         labels: Optional[torch.Tensor],
         buffer: Dict,
-    ) -> Callable[[torch.Tensor], torch.Tensor]:
+        batch_size: Optional[int] = None,
+    ) -> Callable[..., torch.Tensor]:
+        """
+        The returned function takes `inp` of shape (batch, num_init_samples, ...).
+        It optionally also takes `index` of the rows of the batch that `inp` corresponds to.
+        In that case the same rows are selected from `x`, `labels` and `buffer`,
+        which requires `batch_size`.
+        """
         # Sampler gets labels of shape (batch, ...), hence this
         # function will get labels of shape (batch*num_init_samples, ...)
         # but Loss expect y or shape (batch, num_samples or 1, ...)
@@ -307,13 +809,25 @@ class GradientBasedInferenceSampler(Sampler):
         if self.training and (labels is None):
             warnings.warn("Labels should not be None in training mode!")
 
-        def loss_fn(inp: torch.Tensor) -> torch.Tensor:
+        def loss_fn(
+            inp: torch.Tensor, index: Optional[torch.Tensor] = None
+        ) -> torch.Tensor:
+            if index is None:
+                return self.loss_fn(
+                    x,
+                    labels,  # E:labels.unsqueeze(1)
+                    inp,  # E:inp.unsqueeze(1),
+                    None,
+                    buffer,
+                )
+            assert batch_size is not None
+
             return self.loss_fn(
-                x,
-                labels,  # E:labels.unsqueeze(1)
-                inp,  # E:inp.unsqueeze(1),
+                index_batch(x, index, batch_size),
+                index_batch(labels, index, batch_size),
+                inp,
                 None,
-                buffer,
+                index_batch(buffer, index, batch_size),
             )
 
         return loss_fn
@@ -385,29 +899,44 @@ class GradientBasedInferenceSampler(Sampler):
             finally:
                 pass
 
-    def get_samples_from_trajectory(
-        self,
-        trajectory: List[torch.Tensor],
-        loss_values_tensors: List[torch.Tensor],
-        loss_values: List[float],
-    ) -> torch.Tensor:
-        samples_to_keep, loss_values_to_keep = self.sample_picker(
-            trajectory, loss_values_tensors, loss_values
-        )
-        # samples_to_keep : List[Tensor(batch, num_init_samples,...)]
-        num_samples = len(samples_to_keep)
-        temp = torch.cat(
-            samples_to_keep, dim=1
-        )  # (batch, num_init_samples*num_samples, ...)
-        shape = temp.shape
-
-        return temp  # (batch, num_init*num_samples,...)
-        # E:
-        # return temp.reshape(
-        # shape[0] // self.number_init_samples,
-        # self.number_init_samples * num_samples,
-        # *shape[2:],
-        # )  # (batch, num_init_samples*num_samples, ...)
+    @staticmethod
+    def get_number_of_steps(
+        stopping_criteria: Union[int, StoppingCriteria]
+    ) -> Optional[int]:
+        """The exact number of gradient steps that inference will take, if known upfront."""
+
+        if isinstance(stopping_criteria, int):
+            return stopping_criteria
+
+        if isinstance(
+            stopping_criteria, StopAfterNumberOfSteps
+        ) and not isinstance(stopping_criteria, PerInstanceStoppingCriteria):
+            return stopping_criteria.number_of_steps
+
+        return None
+
+    def get_warm_start_keys(self, meta: Any) -> Optional[List[str]]:
+        """Keys for the `warm_start_cache` using the `idx` of every instance in the batch.
+
+        Returns None if the cache should not be used for this batch.
+        """
+
+        if self.warm_start_cache is None:
+            return None
+
+        if not (self.training or self.warm_start_in_eval):
+            return None
+
+        if not isinstance(meta, (list, tuple)) or len(meta) == 0:
+            return None
+        ids = [m.get("idx") if isinstance(m, dict) else None for m in meta]
+
+        if any(idx is None for idx in ids):
+            return None
+        # keep the solutions from training and eval mode separate
+        mode = "train" if self.training else "eval"
+
+        return [f"{mode}:{idx}" for idx in ids]
 
     @property
     def is_normalized(self) -> bool:
@@ -436,32 +965,60 @@ class GradientBasedInferenceSampler(Sampler):
         #        labels, self.number_init_samples, dim=0
         #    )
 
+        stopping_criteria = self.stopping_criteria
+        warm_start_keys = self.get_warm_start_keys(kwargs.get("meta"))
+
+        if warm_start_keys is not None:
+            assert self.warm_start_cache is not None
+            init, hits = self.warm_start_cache.lookup(warm_start_keys, init)
+
+            if self.warm_start_stopping_criteria is not None and all(hits):
+                stopping_criteria = self.warm_start_stopping_criteria
+
         if labels is not None:
             labels = labels.unsqueeze(1)
         # switch of gradients on parameters using context manager
-        with self.no_param_grad():
+        # and encode x only once for all the steps and init samples
+        x_encoding_context = (
+            self.score_nn.cached_x_encoding(x, buffer)
+            if self.score_nn is not None
+            else contextlib.nullcontext()
+        )
+        with self.no_param_grad(), x_encoding_context:
 
             loss_fn = self.get_loss_fn(
                 x,
                 labels,
                 buffer,
+                batch_size=init.shape[0],
             )  #: Loss function will expect labels in form (batch, num_samples or 1, ...)
+            # the picker sees the trajectory step by step
+            # so that the complete trajectory need not be kept.
+            accumulator = self.sample_picker.accumulator(
+                self.get_number_of_steps(stopping_criteria)
+            )
             (
-                trajectory,  # new List[Tensor(batch, num_init_samples, ...)]
-                loss_values_tensors,
+                samples_to_keep,  # List[Tensor(batch, num_init_samples, ...)]
+                loss_values_to_keep,
                 loss_values,
             ) = self.gradient_descent_loop(
                 init,
                 loss_fn,
-                self.stopping_criteria,
+                stopping_criteria,
                 self.output_space.projection_function_,
+                accumulator=accumulator,
+            )
+
+        if warm_start_keys is not None:
+            assert self.warm_start_cache is not None
+            assert accumulator.last_point is not None
+            self.warm_start_cache.update(
+                warm_start_keys, accumulator.last_point
             )
 
         # print(f"\nloss_values:\n{loss_values}")
 
         return (
-            self.get_samples_from_trajectory(
-                trajectory, loss_values_tensors, loss_values
-            ),  # (batch, num_samples, ...)
+            torch.cat(samples_to_keep, dim=1),  # (batch, num_samples, ...)
             torch.tensor(loss_values),
         )
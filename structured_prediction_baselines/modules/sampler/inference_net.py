@@ -30,6 +30,26 @@ from structured_prediction_baselines.modules.task_nn import (
     CostAugmentedLayer,
 )
 
+#: buffer key under which the forward passes of inference networks are counted
+NUM_FORWARDS_KEY = "num_inference_nn_forwards"
+
+
+def run_inference_nn(
+    inference_nn: TaskNN, x: Any, buffer: Dict
+) -> torch.Tensor:
+    """Runs the inference network and counts the call in
+    `buffer["num_inference_nn_forwards"]`, which gives the number
+    of forward passes of inference networks for the batch.
+
+    Returns:
+        Tensor of shape (batch, 1, ...)
+    """
+    buffer[NUM_FORWARDS_KEY] = buffer.get(NUM_FORWARDS_KEY, 0) + 1
+    # inference_nn is TaskNN so it will output tensor of shape (batch, ...)
+    # hence the unsqueeze
+
+    return inference_nn(x, buffer).unsqueeze(1)
+
 
 @Sampler.register("inference-network", constructor="from_partial_objects")
 class InferenceNetSampler(Sampler):
@@ -67,6 +87,10 @@ class InferenceNetSampler(Sampler):
 
         return False
 
+    @property
+    def updates_parameters(self) -> bool:
+        return True
+
     @classmethod
     def from_partial_objects(
         cls,
@@ -181,8 +205,8 @@ class InferenceNetSampler(Sampler):
         **kwargs: Any,
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
         if labels is None or (not self.training):
-            y_inf: torch.Tensor = self.inference_nn(x, buffer).unsqueeze(
-                1
+            y_inf: torch.Tensor = run_inference_nn(
+                self.inference_nn, x, buffer
             )  # (batch_size, 1, ...)
 
             return y_inf, None
@@ -202,13 +226,9 @@ class InferenceNetSampler(Sampler):
                     step_number, float(loss_value)
                 ):
                     self.optimizer.zero_grad(set_to_none=True)
-                    y_inf: torch.Tensor = self.inference_nn(
-                        x, buffer
-                    ).unsqueeze(
-                        1
+                    y_inf = run_inference_nn(
+                        self.inference_nn, x, buffer
                     )  # (batch_size, 1, ...) unormalized
-                    # inference_nn is TaskNN so it will output tensor of shape (batch, ...)
-                    # hence the unsqueeze
 
                     if self.cost_augmented_layer is not None:
                         y_cost_aug = self.cost_augmented_layer(
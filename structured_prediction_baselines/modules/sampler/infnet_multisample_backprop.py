@@ -12,6 +12,7 @@ from typing import (
 )
 
 import torch
+from allennlp.common.checks import ConfigurationError
 from allennlp.common.lazy import Lazy
 from allennlp.training.optimizers import Optimizer
 
@@ -20,6 +21,13 @@ from structured_prediction_baselines.modules.oracle_value_function import (
     OracleValueFunction,
 )
 from structured_prediction_baselines.modules.sampler import Sampler
+from structured_prediction_baselines.modules.sampler.sampling_strategy import (
+    SamplingStrategy,
+    IIDSampling,
+)
+from structured_prediction_baselines.modules.sampler.inference_net import (
+    run_inference_nn,
+)
 from structured_prediction_baselines.modules.stopping_criteria import (
     StoppingCriteria,
     StopAfterNumberOfSteps,
@@ -54,8 +62,21 @@ class InfnetMultiSampleLearner(Sampler):
         cost_augmented_layer: Optional[CostAugmentedLayer] = None,
         oracle_value_function: Optional[OracleValueFunction] = None,
         stopping_criteria: Union[int, StoppingCriteria] = 1,
+        fused_scoring: bool = True,
+        sampling_strategy: Optional[SamplingStrategy] = None,
         **kwargs: Any,
     ):
+        """
+        Args:
+            fused_scoring: Score y_hat, the cost augmented output (both as is and normalized)
+                and the samples with a single score_nn call per step, and compute the
+                x-encoding of the score_nn once per batch. The losses reuse these scores
+                (see :meth:`ScoreNN.precomputed_scores` and :meth:`Loss.shared_normalization`).
+                After the first step, only the tensors that the losses actually scored are
+                scored.
+            sampling_strategy: How the discrete samples are drawn (iid by default) and the
+                control variate applied to their weights. See :class:`SamplingStrategy`.
+        """
         assert ScoreNN is not None
         super().__init__(
             score_nn,
@@ -81,6 +102,17 @@ class InfnetMultiSampleLearner(Sampler):
         self.num_samples = num_samples
         self.keep_probs = keep_probs
 
+        self.fused_scoring = fused_scoring
+        # which of the candidates for fused scoring the losses use, known after the first step
+        self._fused_ys_used: Optional[List[bool]] = None
+        self.sampling_strategy = sampling_strategy or IIDSampling()
+
+        if keep_probs and self.sampling_strategy.leave_one_out_baseline:
+            # the baseline would mix the weight of y_hat into the ones of the samples
+            raise ConfigurationError(
+                "leave-one-out baseline cannot be used with keep_probs"
+            )
+
     ## copied from "InferenceNetSampler"
     @property
     def is_normalized(self) -> bool:
@@ -88,6 +120,10 @@ class InfnetMultiSampleLearner(Sampler):
 
         return False
 
+    @property
+    def updates_parameters(self) -> bool:
+        return True
+
     @classmethod
     def from_partial_objects(
         cls,
@@ -103,6 +139,8 @@ class InfnetMultiSampleLearner(Sampler):
         cost_augmented_layer: Optional[CostAugmentedLayer] = None,
         oracle_value_function: Optional[OracleValueFunction] = None,
         stopping_criteria: Union[int, StoppingCriteria] = 1,
+        fused_scoring: bool = True,
+        sampling_strategy: Optional[SamplingStrategy] = None,
         **kwargs: Any,
     ) -> "InfnetMultiSampleLearner":
         loss_fn_ = loss_fn.construct(
@@ -140,6 +178,8 @@ class InfnetMultiSampleLearner(Sampler):
             cost_augmented_layer=cost_augmented_layer,
             oracle_value_function=oracle_value_function,
             stopping_criteria=stopping_criteria,
+            fused_scoring=fused_scoring,
+            sampling_strategy=sampling_strategy,
         )
     
     def get_dtype_device(self) -> Tuple[torch.dtype, torch.device]:
@@ -199,14 +239,8 @@ class InfnetMultiSampleLearner(Sampler):
         #     torch.sigmoid(y_cost_aug) if y_cost_aug is not None else None
         # )                    
         if self.training and self.num_samples>0:  # sample during training --> already above so delete (later). 
-            p = y_hat_n.squeeze(1)  # (batch, num_labels)
-
-            discrete_samples = torch.transpose(
-                torch.distributions.Bernoulli(probs=p).sample(
-                    [self.num_samples]  # (num_samples, batch, num_labels)
-                ),
-                0,
-                1,
+            discrete_samples = self.sampling_strategy.sample(
+                y_hat_n, self.num_samples
             )  # (batch, num_samples, num_labels)
             if self.keep_probs:
                 samples = torch.cat(
@@ -229,14 +263,20 @@ class InfnetMultiSampleLearner(Sampler):
         **kwargs: Any,
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
         if labels is None or (not self.training):
-            y_inf: torch.Tensor = self.inference_nn(x, buffer).unsqueeze(
-                1
+            y_inf: torch.Tensor = run_inference_nn(
+                self.inference_nn, x, buffer
             )  # (batch_size, 1, ...)
 
             return y_inf, None
         else:
             # switch on gradients on the parameters of inference network using context manager
-            with self.only_inference_nn_grad_on():
+            # score_nn is not updated here, so all the steps can share its x-encoding
+            x_encoding_context = (
+                self.score_nn.cached_x_encoding(x, buffer)
+                if self.fused_scoring
+                else contextlib.nullcontext()
+            )
+            with self.only_inference_nn_grad_on(), x_encoding_context:
                 labels = labels.unsqueeze(1)
                 # loss_fn = self.get_loss_fn(
                 #     x, labels
@@ -250,13 +290,9 @@ class InfnetMultiSampleLearner(Sampler):
                     step_number, float(loss_value)
                 ):
                     self.optimizer.zero_grad(set_to_none=True)
-                    y_inf: torch.Tensor = self.inference_nn(
-                        x, buffer
-                    ).unsqueeze(
-                        1
+                    y_inf = run_inference_nn(
+                        self.inference_nn, x, buffer
                     )  # (batch_size, 1, ...) unormalized
-                    # inference_nn is TaskNN so it will output tensor of shape (batch, ...)
-                    # hence the unsqueeze
 
                     if self.cost_augmented_layer is not None:
                         y_cost_aug = self.cost_augmented_layer(
@@ -275,9 +311,42 @@ class InfnetMultiSampleLearner(Sampler):
                         y_cost_aug = None
                         
                     samples = self.draw_samples(y_inf)
-                    loss_value = self.update( # made self.update to be the same as Loss class forward()
-                        x, labels, samples, y_inf, y_cost_aug, buffer 
-                    )
+
+                    if self.fused_scoring:
+                        # score y_inf, y_cost_aug and the samples with one score_nn call.
+                        # The gradients w.r.t. the samples are then taken through it.
+                        if samples is not None and not samples.requires_grad:
+                            samples.requires_grad_(True)
+                        # losses with normalize_y score these normalized tensors
+                        normalized_pairs = [
+                            (y, torch.sigmoid(y) if y is not None else None)
+                            for y in (y_inf, y_cost_aug)
+                        ]
+                        fused_ys = [
+                            y for pair in normalized_pairs for y in pair
+                        ] + [samples]
+
+                        if self._fused_ys_used is not None:
+                            fused_ys = [
+                                y if is_used else None
+                                for y, is_used in zip(
+                                    fused_ys, self._fused_ys_used
+                                )
+                            ]
+                    else:
+                        normalized_pairs = []
+                        fused_ys = []
+                    with Loss.shared_normalization(
+                        normalized_pairs, buffer
+                    ), self.score_nn.precomputed_scores(
+                        x, fused_ys, buffer
+                    ) as fused_ys_used:
+                        loss_value = self.update( # made self.update to be the same as Loss class forward()
+                            x, labels, samples, y_inf, y_cost_aug, buffer 
+                        )
+
+                    if self._fused_ys_used is None and fused_ys_used is not None:
+                        self._fused_ys_used = fused_ys_used
                     loss_values.append(float(loss_value))
 
                     step_number += 1
@@ -322,6 +391,7 @@ class InfnetMultiSampleLearner(Sampler):
                     samples,
                     buffer,
             ) # (batch, num_samples, num_labels) grab gradients w.r.t.samples from score loss.
+            grad_samples = self.sampling_strategy.baseline(grad_samples)
 
             loss_samples = grad_samples*loss_samples
             total_loss = total_loss + torch.sum(self.sample_loss_weight * loss_samples) # shouldn't it be mean?
@@ -358,7 +428,8 @@ class InfnetMultiSampleLearner(Sampler):
                 buffer,
             )
             loss = torch.mean(loss_for_grad) #ToDo: change this mean to torch.sum(), and chagne sum() on the update funciton. 
-            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True   )
+            # retain the graph as it can be shared with the main loss (fused_scoring)
+            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True, retain_graph=True)
         return grad_samples[0].clone().detach() # grad returns tuple. list of length 1.
 
 
@@ -20,6 +20,9 @@ from structured_prediction_baselines.modules.oracle_value_function import (
     OracleValueFunction,
 )
 from structured_prediction_baselines.modules.sampler import Sampler, InfnetMultiSampleLearner
+from structured_prediction_baselines.modules.sampler.sampling_strategy import (
+    SamplingStrategy,
+)
 from structured_prediction_baselines.modules.stopping_criteria import (
     StoppingCriteria,
     StopAfterNumberOfSteps,
@@ -76,7 +79,8 @@ class InfnetMultiSampleProbReduceFix(InfnetMultiSampleLearner):
             keep_probs,
             cost_augmented_layer,
             oracle_value_function,
-            stopping_criteria
+            stopping_criteria,
+            **kwargs,
         )
 
     def update(
@@ -116,6 +120,7 @@ class InfnetMultiSampleProbReduceFix(InfnetMultiSampleLearner):
                     samples,
                     buffer,
             ) # (batch, num_samples, num_labels) grab gradients w.r.t.samples from score loss.
+            grad_samples = self.sampling_strategy.baseline(grad_samples)
 
             loss_samples = grad_samples*sample_prob
             total_loss = torch.mean(
@@ -154,7 +159,8 @@ class InfnetMultiSampleProbReduceFix(InfnetMultiSampleLearner):
                 buffer,
             )
             loss = torch.sum(loss_for_grad) 
-            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True   )
+            # retain the graph as it can be shared with the main loss (fused_scoring)
+            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True, retain_graph=True)
 
         return grad_samples[0].clone().detach() # grad returns tuple. list of length 1.
 
@@ -203,7 +209,8 @@ class InfnetMultiSampleReduceFix(InfnetMultiSampleProbReduceFix):
             keep_probs,
             cost_augmented_layer,
             oracle_value_function,
-            stopping_criteria
+            stopping_criteria,
+            **kwargs,
         )
 
     def update(
@@ -243,6 +250,7 @@ class InfnetMultiSampleReduceFix(InfnetMultiSampleProbReduceFix):
                     samples,
                     buffer,
             ) # (batch, num_samples, num_labels) grab gradients w.r.t.samples from score loss.
+            grad_samples = self.sampling_strategy.baseline(grad_samples)
             loss_samples = grad_samples*sample_prob
             total_loss = torch.mean(
                     total_loss + torch.mean(self.sample_loss_weight * loss_samples, dim=1, keepdim=True)
@@ -284,6 +292,7 @@ class InfnetMultiSampleDebug(InfnetMultiSampleLearner):
             cost_augmented_layer,
             oracle_value_function,
             stopping_criteria,
+            **kwargs,
         )
 
     @classmethod
@@ -301,6 +310,8 @@ class InfnetMultiSampleDebug(InfnetMultiSampleLearner):
         cost_augmented_layer: Optional[CostAugmentedLayer] = None,
         oracle_value_function: Optional[OracleValueFunction] = None,
         stopping_criteria: Union[int, StoppingCriteria] = 1,
+        fused_scoring: bool = True,
+        sampling_strategy: Optional[SamplingStrategy] = None,
         **kwargs: Any,
     ) -> "InfnetMultiSampleDebug":
         loss_fn_ = loss_fn.construct(
@@ -338,6 +349,8 @@ class InfnetMultiSampleDebug(InfnetMultiSampleLearner):
             cost_augmented_layer=cost_augmented_layer,
             oracle_value_function=oracle_value_function,
             stopping_criteria=stopping_criteria,
+            fused_scoring=fused_scoring,
+            sampling_strategy=sampling_strategy,
         )
     # the only override done.
     def update(
@@ -415,6 +428,7 @@ class InfnetMultiSampleDebug(InfnetMultiSampleLearner):
             )
             
             loss = torch.sum(loss_for_grad) 
-            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True)
+            # retain the graph as it can be shared with the main loss (fused_scoring)
+            grad_samples = torch.autograd.grad(outputs=loss, inputs=samples, only_inputs=True, retain_graph=True)
 
         return grad_samples[0].clone().detach() # grad returns tuple. list of length 1.
\ No newline at end of file
@@ -1,4 +1,7 @@
-from typing import List, Tuple, Union, Dict, Any, Optional
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterator
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+from allennlp.common.checks import ConfigurationError
 from allennlp.common.registrable import Registrable
 import torch
 from allennlp.common.lazy import Lazy
@@ -63,6 +66,13 @@ class Sampler(torch.nn.Module, Registrable):
     def different_training_and_eval(self) -> bool:
         return self._different_training_and_eval
 
+    @property
+    def updates_parameters(self) -> bool:
+        """Whether the sampler updates the parameters of a model in its forward,
+        like the inference network samplers do."""
+
+        return False
+
 
 @Sampler.register(
     "appending-container", constructor="from_partial_constituent_samplers"
@@ -73,6 +83,14 @@ class AppendingSamplerContainer(Sampler):
 
     This class is useful, for example, when you want each batch to have samples
     from ground truth, gradient based inference as well as adversarial.
+
+    With `parallel=True`, the constituent samplers run concurrently in a pool of threads.
+    PyTorch releases the GIL inside its ops, so independent inference loops, like two
+    gradient based inference samplers, then take about as long as the slowest one.
+    This mode only supports samplers that do not update any parameters (gradient based
+    inference, ground truth, etc.). Every sampler gets a shallow copy of the buffer and
+    the entries they add or replace are merged back in the order of the samplers.
+    The order in which the samplers consume random numbers is not deterministic in this mode.
     """
 
     def __init__(
@@ -80,16 +98,33 @@ class AppendingSamplerContainer(Sampler):
         constituent_samplers: List[Sampler],
         score_nn: Optional[ScoreNN] = None,
         oracle_value_function: Optional[OracleValueFunction] = None,
+        parallel: bool = False,
+        num_workers: Optional[int] = None,
     ):
+        """
+        Args:
+            parallel: Run the constituent samplers in a thread pool.
+            num_workers: Size of the thread pool. Defaults to the number of constituent samplers.
+        """
         super().__init__(score_nn, oracle_value_function)
         self.constituent_samplers = torch.nn.ModuleList(constituent_samplers)
 
+        if parallel and self.updates_parameters:
+            raise ConfigurationError(
+                "parallel appending-container does not support samplers "
+                "that update parameters, like inference networks."
+            )
+        self.parallel = parallel
+        self.num_workers = num_workers or len(self.constituent_samplers)
+
     @classmethod
     def from_partial_constituent_samplers(
         cls,
         constituent_samplers: List[Lazy[Sampler]],
         score_nn: Optional[ScoreNN] = None,
         oracle_value_function: Optional[OracleValueFunction] = None,
+        parallel: bool = False,
+        num_workers: Optional[int] = None,
     ) -> Sampler:
         constructed_samplers = [
             sampler.construct(
@@ -102,7 +137,87 @@ class AppendingSamplerContainer(Sampler):
             constructed_samplers,
             score_nn=score_nn,
             oracle_value_function=oracle_value_function,
+            parallel=parallel,
+            num_workers=num_workers,
+        )
+
+    @property
+    def updates_parameters(self) -> bool:
+        return any(
+            sampler.updates_parameters for sampler in self.constituent_samplers
+        )
+
+    @contextlib.contextmanager
+    def no_param_grad(self) -> Iterator[None]:
+        """
+        Switches off the gradients of all the parameters of the constituent samplers.
+
+        The samplers toggle `requires_grad` of the (shared) score_nn parameters themselves,
+        which is not safe when they run concurrently. With all of them switched off upfront,
+        the samplers only ever save and restore False.
+        """
+        requires_grad_map = {
+            name: param.requires_grad
+            for name, param in self.named_parameters()
+        }
+        try:
+            for param in self.parameters():
+                param.requires_grad = False
+            yield
+        finally:
+            for n, p in self.named_parameters():
+                p.requires_grad = requires_grad_map[n]
+
+    def parallel_forward(
+        self,
+        x: Any,
+        labels: Optional[torch.Tensor],
+        buffer: Dict,
+        **kwargs: Any,
+    ) -> List[Tuple[torch.Tensor, Optional[torch.Tensor]]]:
+        # avoid circular import
+        from structured_prediction_baselines.modules.sampler.gradient_based_inference import (
+            disable_log,
+            params,
+            optimizers,
+        )
+
+        # grad mode is thread local
+        grad_enabled = torch.is_grad_enabled()
+
+        def run(
+            sampler: Sampler, sampler_buffer: Dict
+        ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+            with torch.set_grad_enabled(grad_enabled):
+                return sampler(x, labels, sampler_buffer, **kwargs)
+
+        # encode x once here, so that the samplers share it. Lower the log levels
+        # that GBI lowers and restores for every sampler once here, so that the
+        # threads only ever save and restore the lowered levels.
+        x_encoding_context = (
+            self.score_nn.cached_x_encoding(x, buffer)
+            if self.score_nn is not None
+            else contextlib.nullcontext()
         )
+        with self.no_param_grad(), x_encoding_context, disable_log(
+            [params, optimizers]
+        ):
+            buffers = [dict(buffer) for _ in self.constituent_samplers]
+            with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+                outputs = list(
+                    pool.map(run, self.constituent_samplers, buffers)
+                )
+
+            for sampler_buffer in buffers:
+                buffer.update(
+                    {
+                        key: value
+                        for key, value in sampler_buffer.items()
+                        if key not in buffer or buffer[key] is not value
+                    }
+                )
+
+        return outputs
 
     def forward(
         self,
@@ -111,13 +226,15 @@ class AppendingSamplerContainer(Sampler):
         buffer: Dict,
         **kwargs: Any,
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        if self.parallel and len(self.constituent_samplers) > 1:
+            outputs = self.parallel_forward(x, labels, buffer, **kwargs)
+        else:
+            outputs = [
+                sampler(x, labels, buffer, **kwargs)
+                for sampler in self.constituent_samplers
+            ]
         samples, probs = list(
-            zip(
-                *[
-                    sampler(x, labels, buffer, **kwargs)
-                    for sampler in self.constituent_samplers
-                ]
-            )
+            zip(*outputs)
         )  # samples: List[Tensor(batch, num_samples_for_sampler, ...)],
         # probs: List[Tensor(batch, num_samples_for_sampler, ...) or None]
 
@@ -158,6 +275,12 @@ class RandomPickingSamplerContainer(Sampler):
             total = len(self.constituent_samplers)
             self.probabilities = [1.0 / total] * total
 
+    @property
+    def updates_parameters(self) -> bool:
+        return any(
+            sampler.updates_parameters for sampler in self.constituent_samplers
+        )
+
     @classmethod
     def from_partial_constituent_samplers(
         cls,
@@ -0,0 +1,178 @@
+"""Ways of drawing discrete samples from the output of an inference network
+for the multi-sample learners."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+from allennlp.common.checks import ConfigurationError
+from allennlp.common.registrable import Registrable
+import torch
+
+
+class SamplingStrategy(Registrable):
+    """
+    Draws binary samples from independent Bernoulli distributions by thresholding
+    uniforms, i.e., `s = (u < p)`. Subclasses only change how the uniforms
+    `u` of shape (batch, num_samples, num_labels) are generated.
+
+    Optionally, a leave-one-out control variate is applied to the weights of the
+    samples (the gradients of the score w.r.t. the samples). The weight of every
+    sample is reduced by the mean weight of the other samples. For independent samples,
+    the baseline of a sample does not depend on it and the score function (log-probability)
+    estimator stays unbiased. With correlated samples (antithetic, Sobol) it would be biased,
+    hence only the strategies with `supports_leave_one_out_baseline` accept it.
+    """
+
+    default_implementation = "iid"
+
+    #: Whether the samples are independent, so that the leave-one-out baseline is unbiased.
+    supports_leave_one_out_baseline: bool = False
+
+    def __init__(self, leave_one_out_baseline: bool = False) -> None:
+        if leave_one_out_baseline and not self.supports_leave_one_out_baseline:
+            raise ConfigurationError(
+                f"{type(self).__name__} draws correlated samples, "
+                "the leave-one-out baseline would make the estimator biased."
+            )
+        self.leave_one_out_baseline = leave_one_out_baseline
+
+    def uniforms(
+        self,
+        batch_size: int,
+        num_samples: int,
+        num_labels: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> torch.Tensor:
+        """
+        Returns:
+            uniforms in [0, 1) of shape (batch, num_samples, num_labels)
+        """
+        raise NotImplementedError
+
+    def sample(
+        self,
+        probs: torch.Tensor,  #: (batch, 1, num_labels)
+        num_samples: int,
+    ) -> torch.Tensor:
+        """
+        Returns:
+            samples of shape (batch, num_samples, num_labels) with the dtype of probs
+        """
+        batch_size, _, num_labels = probs.shape
+        u = self.uniforms(
+            batch_size, num_samples, num_labels, probs.dtype, probs.device
+        )
+
+        return (u < probs.detach()).to(dtype=probs.dtype)
+
+    def baseline(
+        self, weights: torch.Tensor  #: (batch, num_samples, ...)
+    ) -> torch.Tensor:
+        """Applies the control variate, if any, to the weights of the samples."""
+
+        if not self.leave_one_out_baseline:
+            return weights
+        num_samples = weights.shape[1]
+
+        if num_samples < 2:
+            return weights
+        others_mean = (
+            torch.sum(weights, dim=1, keepdim=True) - weights
+        ) / (num_samples - 1)
+
+        return weights - others_mean
+
+
+@SamplingStrategy.register("iid")
+class IIDSampling(SamplingStrategy):
+    """Independent samples. Same as sampling from `torch.distributions.Bernoulli`."""
+
+    supports_leave_one_out_baseline = True
+
+    def uniforms(
+        self,
+        batch_size: int,
+        num_samples: int,
+        num_labels: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> torch.Tensor:
+        return torch.rand(
+            (batch_size, num_samples, num_labels), dtype=dtype, device=device
+        )
+
+
+@SamplingStrategy.register("leave-one-out")
+class LeaveOneOutSampling(IIDSampling):
+    """Independent samples with the leave-one-out control variate."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        kwargs.setdefault("leave_one_out_baseline", True)
+        super().__init__(**kwargs)
+
+
+@SamplingStrategy.register("antithetic")
+class AntitheticSampling(SamplingStrategy):
+    """
+    Samples in antithetic pairs, `u` and `1 - u`, which are negatively
+    correlated. With an odd `num_samples`, the last sample is unpaired.
+    """
+
+    def uniforms(
+        self,
+        batch_size: int,
+        num_samples: int,
+        num_labels: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> torch.Tensor:
+        u = torch.rand(
+            (batch_size, num_samples // 2, num_labels),
+            dtype=dtype,
+            device=device,
+        )
+        parts = [u, 1.0 - u]
+
+        if num_samples % 2:
+            parts.append(
+                torch.rand(
+                    (batch_size, 1, num_labels), dtype=dtype, device=device
+                )
+            )
+
+        return torch.cat(parts, dim=1)
+
+
+@SamplingStrategy.register("sobol")
+class SobolSampling(SamplingStrategy):
+    """
+    Quasi-Monte Carlo samples. The `num_samples` uniforms come from a scrambled Sobol
+    sequence over the labels, which spreads them evenly in [0, 1)^num_labels. Every example
+    gets an independent random shift (modulo 1) of these points, which keeps each sample
+    distributed exactly as Bernoulli(p) and the examples independent.
+    """
+
+    def __init__(self, seed: Optional[int] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.seed = seed
+        self._engine: Optional[torch.quasirandom.SobolEngine] = None
+
+    def uniforms(
+        self,
+        batch_size: int,
+        num_samples: int,
+        num_labels: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> torch.Tensor:
+        if self._engine is None or self._engine.dimension != num_labels:
+            self._engine = torch.quasirandom.SobolEngine(
+                num_labels, scramble=True, seed=self.seed
+            )
+        # the engine is on the cpu
+        points = (
+            self._engine.draw(num_samples).to(dtype=dtype, device=device)
+        )  # (num_samples, num_labels)
+        shift = torch.rand(
+            (batch_size, 1, num_labels), dtype=dtype, device=device
+        )
+
+        return torch.remainder(points.unsqueeze(0) + shift, 1.0)
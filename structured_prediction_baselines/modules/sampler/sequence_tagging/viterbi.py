@@ -0,0 +1,229 @@
+from typing import List, Tuple, Union, Dict, Any, Optional
+from allennlp.common.checks import ConfigurationError
+from allennlp.data import TextFieldTensors
+from structured_prediction_baselines.modules.sampler import Sampler
+from structured_prediction_baselines.modules.score_nn import ScoreNN
+from structured_prediction_baselines.modules.oracle_value_function import (
+    OracleValueFunction,
+)
+from structured_prediction_baselines.modules.structured_score.sequence_tagging.linear_chain import (
+    LinearChain,
+)
+import allennlp.nn.util as util
+import torch
+import torch.nn.functional as F
+
+
+@Sampler.register("sequence-tagging-viterbi")
+class ViterbiSampler(Sampler):
+    """
+    Exact inference (max-product) for `SequenceTaggingScoreNN` with a `LinearChain`
+    or `SkipChain` global score.
+
+    The potentials are the local scores `y_local` from the `task_nn` and the
+    transition tensor `W` of the chain. For a chain of order M, the state at
+    position t is the tuple of the last M tags, so the cost is O(T.C^(M+1)).
+    The computation is vectorized over the batch and the states, and only loops over time.
+
+    With `num_samples` k > 1, the k highest scoring sequences are decoded (k-best Viterbi)
+    by keeping the k best partial sequences of every state, which multiplies the cost by k.
+
+    Returns one-hot samples of shape (batch, num_samples, seq_len, num_tags),
+    in decreasing order of score.
+    """
+
+    def __init__(
+        self,
+        score_nn: Optional[ScoreNN] = None,
+        oracle_value_function: Optional[OracleValueFunction] = None,
+        num_samples: int = 1,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            num_samples: Number of highest scoring sequences to decode. If a sequence has
+                fewer taggings than that, the extra samples are arbitrary.
+        """
+        super().__init__(
+            score_nn=score_nn, oracle_value_function=oracle_value_function
+        )
+
+        if self.score_nn is None:
+            raise ConfigurationError("ViterbiSampler needs a score_nn")
+
+        if not (
+            self.score_nn.global_score is None
+            or isinstance(self.score_nn.global_score, LinearChain)
+        ):
+            raise ConfigurationError(
+                "ViterbiSampler only supports linear-chain or skip-chain global scores"
+            )
+
+        if num_samples < 1:
+            raise ConfigurationError("num_samples should be at least 1")
+        self.num_samples = num_samples
+
+    @property
+    def is_normalized(self) -> bool:
+        return True
+
+    def forward(
+        self,
+        x: TextFieldTensors,
+        labels: Optional[torch.Tensor],
+        buffer: Dict,
+        **kwargs: Any,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        assert self.score_nn is not None
+        with torch.no_grad():
+            y_local = self.score_nn.get_x_encoding(
+                x, buffer
+            )  # (batch, seq_len, num_tags)
+            mask = buffer.get("mask")
+
+            if mask is None:
+                mask = util.get_text_field_mask(x)
+                buffer["mask"] = mask
+            mask = mask.reshape(y_local.shape[:-1])  # (batch, seq_len)
+            tags = self.decode(
+                y_local, mask, self.num_samples
+            )  # (batch, num_samples, seq_len)
+
+        samples = F.one_hot(tags, num_classes=y_local.shape[-1]).to(
+            dtype=y_local.dtype
+        )
+
+        return samples, None  # (batch, num_samples, seq_len, num_tags)
+
+    def decode(
+        self,
+        y_local: torch.Tensor,  #: (batch, seq_len, num_tags)
+        mask: torch.Tensor,  #: (batch, seq_len)
+        num_samples: int = 1,
+    ) -> torch.Tensor:
+        """
+        Returns:
+            The `num_samples` highest scoring tags of shape (batch, num_samples, seq_len),
+            in decreasing order of score. Tags at the padded positions are arbitrary.
+        """
+        assert self.score_nn is not None
+        batch_size, seq_len, num_tags = y_local.shape
+        chain = self.score_nn.global_score
+
+        if chain is None:
+            if num_samples == 1:
+                return torch.argmax(y_local, dim=-1).unsqueeze(1)
+            # independent positions are a chain without transitions
+            M = 1
+            W = y_local.new_zeros((1, num_tags + 1, num_tags + 1))
+        else:
+            M = chain.M
+            W = chain.W.to(dtype=y_local.dtype)  # (M, num_tags+1, num_tags+1)
+        is_padding = ~mask.bool()
+        last = mask.sum(1).long() - 1  # (batch,)
+        # The padded positions get the tag 0, so that sequences
+        # which differ only there are not decoded more than once.
+        padding_energy = y_local.new_full((num_tags,), float("-inf"))
+        padding_energy[0] = 0.0
+
+        def place(
+            potential: torch.Tensor, dims: List[int], k: int
+        ) -> torch.Tensor:
+            """Views `potential` as (1, ...) with num_tags on `dims` out of `k` state dims."""
+            shape = [1] * (k + 1)
+
+            for d in dims:
+                shape[d + 1] = num_tags
+
+            return potential.reshape(shape)
+
+        # scores of the best partial sequences ending in every state,
+        # the last dim holds the (at most num_samples) best ones in decreasing order.
+        # The state at t is the tuple of the last k = min(t+1, M) tags (oldest first).
+        score = y_local.new_zeros((batch_size, 1))
+        # for every step that drops the oldest tag, the index into
+        # (oldest tag, previous rank) and the number of previous ranks.
+        backpointers: List[Tuple[torch.Tensor, int]] = []
+
+        for t in range(seq_len):
+            k = min(t, M)  # number of state dims before step t
+            k_new = min(t + 1, M)
+            num_ranks = score.shape[-1]
+            energy = y_local[:, t].view(
+                batch_size, *([1] * k), num_tags
+            )  # (batch, 1,...,1, num_tags)
+
+            if t < M:  # transition from the start symbol
+                energy = energy + place(W[t, -1, :-1], [k], k + 1)
+
+            for i in range(k):  # transition of order i+1 from y_{t-1-i}
+                energy = energy + place(
+                    W[i, :-1, :-1], [k - 1 - i, k], k + 1
+                )
+            energy = torch.where(
+                is_padding[:, t].view(-1, *([1] * (k + 1))),
+                place(padding_energy, [k], k + 1),
+                energy,
+            )
+            score = score.view(
+                batch_size, *([num_tags] * k), 1, num_ranks
+            ) + energy.unsqueeze(-1)
+
+            if k_new == k:  # drop the oldest tag
+                # (batch, *[num_tags]*M, oldest tag * previous rank)
+                score = score.movedim(1, -2).reshape(
+                    batch_size, *([num_tags] * k), num_tags * num_ranks
+                )
+                score, bp = torch.topk(
+                    score, min(num_samples, score.shape[-1]), dim=-1
+                )
+                backpointers.append((bp, num_ranks))
+
+            # transition to the end symbol if t is the last position
+            end_energy: Union[float, torch.Tensor] = 0.0
+
+            for i in range(min(M, t + 1)):
+                end_energy = end_energy + place(
+                    W[i, :-1, -1], [k_new - 1 - i], k_new
+                ).unsqueeze(-1)
+            is_last = (last == t).to(dtype=y_local.dtype)
+            score = score + end_energy * is_last.view(
+                -1, *([1] * (k_new + 1))
+            )  # (batch, *[num_tags]*k_new, num_ranks)
+
+        # backtrack
+        k = min(seq_len, M)
+        num_ranks = score.shape[-1]
+        flat_score = score.reshape(batch_size, -1)
+        _, best = torch.topk(
+            flat_score, min(num_samples, flat_score.shape[-1]), dim=-1
+        )  # (batch, num_samples)
+
+        if best.shape[-1] < num_samples:  # fewer taggings than samples
+            best = torch.cat(
+                (best, best[:, -1:].expand(-1, num_samples - best.shape[-1])),
+                dim=-1,
+            )
+        rank = best % num_ranks
+        best_state = torch.div(best, num_ranks, rounding_mode="floor")
+        tags: List[torch.Tensor] = []  # in reverse order, each (batch, num_samples)
+
+        for _ in range(k):
+            tags.append(best_state % num_tags)
+            best_state = torch.div(
+                best_state, num_tags, rounding_mode="floor"
+            )
+        batch_index = torch.arange(
+            batch_size, device=y_local.device
+        ).unsqueeze(-1)
+
+        for bp, previous_num_ranks in reversed(backpointers):
+            # the state at t is (y_{t-M+1},...,y_t) and bp gives y_{t-M} with its rank
+            state = tags[-1 : -M - 1 : -1]
+            index = bp[(batch_index, *state, rank)]
+            tags.append(
+                torch.div(index, previous_num_ranks, rounding_mode="floor")
+            )
+            rank = index % previous_num_ranks
+
+        return torch.stack(tags[::-1], dim=-1)
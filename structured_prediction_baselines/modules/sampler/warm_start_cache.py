@@ -0,0 +1,94 @@
+from typing import List, Tuple, Union, Dict, Any, Optional
+from collections import OrderedDict
+from allennlp.common.registrable import Registrable
+import torch
+
+
+class WarmStartCache(Registrable):
+    """
+    A bounded store that maps instance ids to the last solution found
+    by gradient based inference for that instance. The stored solutions
+    can be used as the initialization the next time the same instance is seen.
+
+    The least recently used entries are evicted once `max_size` entries are stored.
+    """
+
+    default_implementation = "lru"
+
+    def __init__(self, max_size: int = 100000, device: Optional[str] = "cpu"):
+        """
+        Args:
+            max_size: Maximum number of instances to keep.
+            device: Device on which the solutions are stored. If None,
+                they are kept on the device on which they were produced.
+        """
+        self.max_size = max_size
+        self.device = device
+        self._store: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._store
+
+    def clear(self) -> None:
+        self._store.clear()
+
+    @torch.no_grad()
+    def lookup(
+        self,
+        keys: List[str],
+        default: torch.Tensor,  #: (batch, num_init_samples, ...)
+    ) -> Tuple[torch.Tensor, List[bool]]:
+        """
+        Returns:
+            values: `default` with the rows of the found keys replaced by the stored solutions.
+            hits: Whether each key was found.
+        """
+        assert len(keys) == default.shape[0]
+        hits = []
+        found: List[torch.Tensor] = []
+
+        for key in keys:
+            value = self._store.get(key)
+            hit = value is not None and value.shape == default.shape[1:]
+            hits.append(hit)
+
+            if hit:
+                self._store.move_to_end(key)
+                found.append(value)  # type: ignore
+
+        if not found:
+            return default, hits
+        index = torch.tensor(
+            [i for i, hit in enumerate(hits) if hit], device=default.device
+        )
+        values = default.index_copy(
+            0,
+            index,
+            torch.stack(found).to(device=default.device, dtype=default.dtype),
+        )
+
+        return values, hits
+
+    @torch.no_grad()
+    def update(
+        self,
+        keys: List[str],
+        values: torch.Tensor,  #: (batch, num_init_samples, ...)
+    ) -> None:
+        assert len(keys) == values.shape[0]
+        # one transfer for the whole batch
+        values = values.detach().to(device=self.device)
+
+        for key, value in zip(keys, values.unbind(0)):
+            # clone so that a stored row does not keep the whole batch alive
+            self._store[key] = value.clone()
+            self._store.move_to_end(key)
+
+        while len(self._store) > self.max_size:
+            self._store.popitem(last=False)
+
+
+WarmStartCache.register("lru")(WarmStartCache)
@@ -1,12 +1,35 @@
-from typing import List, Tuple, Union, Dict, Any, Optional
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterator
 from allennlp.common.registrable import Registrable
+import contextlib
 import torch
 from .task_nn import TaskNN
 from .structured_score.structured_score import StructuredScore
 
 
 class ScoreNN(torch.nn.Module, Registrable):
-    """Concrete base class for creating feature representation for any task."""
+    """Concrete base class for creating feature representation for any task.
+
+    Caching contract for the x-dependent part of the score:
+        Subclasses whose local score uses an encoding of x that does not depend on y
+        (for instance, the label scores produced by the `task_nn`) should set
+        `caches_x_encoding = True`, compute the encoding in `encode_x()` and get it
+        using `get_x_encoding()` in `compute_local_score()`. Samplers that score many
+        y for the same x, like gradient based inference, wrap their loop in
+        `cached_x_encoding()` so that the encoding is computed only once.
+
+    Callers that need the scores of several tensors of y for the same x, possibly through
+    different losses, can score all of them with a single forward pass using
+    `precomputed_scores()`.
+    """
+
+    #: Whether the local score uses an encoding of x that can be cached.
+    caches_x_encoding: bool = False
+
+    #: Key in the buffer under which the x-encoding is cached.
+    x_encoding_key: str = "x_encoding"
+
+    #: Key in the buffer under which the scores precomputed by `precomputed_scores()` are kept.
+    score_memo_key: str = "score_memo"
 
     def __init__(
         self,
@@ -28,6 +51,112 @@ class ScoreNN(torch.nn.Module, Registrable):
 
         return None
 
+    def encode_x(self, x: Any, buffer: Dict) -> Any:
+        """The part of the local score that only depends on x."""
+
+        return self.task_nn(x, buffer)
+
+    def get_x_encoding(self, x: Any, buffer: Dict) -> Any:
+        """Returns the cached x-encoding if present in the buffer, else computes it."""
+        x_encoding = buffer.get(self.x_encoding_key)
+
+        if x_encoding is None:
+            x_encoding = self.encode_x(x, buffer)
+
+        return x_encoding
+
+    @contextlib.contextmanager
+    def cached_x_encoding(self, x: Any, buffer: Dict) -> Iterator[None]:
+        """
+        Computes the x-encoding once, detached from the graph, and keeps it in
+        the buffer for the duration of the context so that all the calls to
+        the score_nn within the context reuse it.
+
+        Note:
+            Only use this when gradients w.r.t. the parameters are not required
+            within the context.
+        """
+
+        if (not self.caches_x_encoding) or (self.x_encoding_key in buffer):
+            # nothing to cache or cached by an outer context
+            yield
+
+            return
+        with torch.no_grad():
+            buffer[self.x_encoding_key] = self.encode_x(x, buffer)
+        try:
+            yield
+        finally:
+            buffer.pop(self.x_encoding_key, None)
+
+    @contextlib.contextmanager
+    def precomputed_scores(
+        self,
+        x: Any,
+        ys: List[Optional[torch.Tensor]],  #: each (batch, num_samples_i, ...)
+        buffer: Dict,
+        **kwargs: Any,
+    ) -> Iterator[Optional[List[bool]]]:
+        """
+        Scores all the `ys` with one forward pass by concatenating them along the samples
+        dimension. Within the context, calling the score_nn with one of the tensors in
+        `ys` (the same object) returns its part of the scores instead of running the network
+        again. Any other y is scored as usual. None entries are ignored.
+
+        Yields:
+            None if nothing was scored here. Otherwise a list, aligned with `ys`, which tells
+            after the context whether the precomputed score of each y was used. Callers that
+            pass the same kind of tensors every step can use it to stop scoring the ones
+            that are not asked for.
+
+        Note:
+            The scores keep their graph, hence, when more than one of them
+            is differentiated, all but the last backward need `retain_graph=True`.
+        """
+        ys_ = [(i, y) for i, y in enumerate(ys) if y is not None]
+
+        if len(ys_) < 2 or self.score_memo_key in buffer:
+            # nothing to fuse or fused by an outer context
+            yield None
+
+            return
+        scores = self(
+            x, torch.cat([y for _, y in ys_], dim=1), buffer, **kwargs
+        )
+        assert scores is not None
+        used = [False] * len(ys)
+        buffer[self.score_memo_key] = (
+            [
+                (i, y, score)
+                for (i, y), score in zip(
+                    ys_,
+                    torch.split(scores, [y.shape[1] for _, y in ys_], dim=1),
+                )
+            ],
+            used,
+        )
+        try:
+            yield used
+        finally:
+            buffer.pop(self.score_memo_key, None)
+
+    def get_precomputed_score(
+        self, y: torch.Tensor, buffer: Dict
+    ) -> Optional[torch.Tensor]:
+        """Score of y computed by `precomputed_scores()`, if any."""
+
+        if self.score_memo_key not in buffer:
+            return None
+        memo, used = buffer[self.score_memo_key]
+
+        for i, y_, score in memo:
+            if y_ is y:
+                used[i] = True
+
+                return score
+
+        return None
+
     def compute_local_score(
         self, x: Any, y: Any, buffer: Dict, **kwargs: Any
     ) -> Optional[torch.Tensor]:
@@ -59,6 +188,10 @@ class ScoreNN(torch.nn.Module, Registrable):
         buffer: Dict,
         **kwargs: Any,
     ) -> Optional[torch.Tensor]:
+        precomputed_score = self.get_precomputed_score(y, buffer)
+
+        if precomputed_score is not None:
+            return precomputed_score
         score = None
         local_score = self.compute_local_score(x, y, buffer, **kwargs)
 
@@ -1,5 +1,7 @@
+from typing import Dict, Optional, Tuple
 from overrides import overrides
 import torch
+import torch.nn.functional as F
 from torch.nn import Dropout, Linear
 
 from allennlp.nn.util import masked_softmax, weighted_sum
@@ -71,6 +73,8 @@ class SelfAttentionEncoder(Seq2SeqEncoder):
         self._scale = (input_dim // num_heads) ** 0.5
         self._output_projection = Linear(values_dim, self._output_dim)
         self._attention_dropout = Dropout(attention_dropout_prob)
+        # band masks for windowed attention keyed by (timesteps, window, device)
+        self._band_masks: Dict[Tuple[int, int, torch.device], torch.BoolTensor] = {}
 
     def get_input_dim(self):
         return self._input_dim
@@ -82,8 +86,70 @@ class SelfAttentionEncoder(Seq2SeqEncoder):
     def is_bidirectional(self):
         return False
 
+    def get_band_mask(
+        self, timesteps: int, window: int, device: torch.device
+    ) -> torch.BoolTensor:
+        """
+        Mask of shape (timesteps, 2 * window + 1) which is True where the
+        neighbour `t - window + w` of position `t` lies within the sequence.
+        """
+        key = (timesteps, window, device)
+        band_mask = self._band_masks.get(key)
+
+        if band_mask is None:
+            positions = (
+                torch.arange(timesteps, device=device).unsqueeze(1)
+                - window
+                + torch.arange(2 * window + 1, device=device).unsqueeze(0)
+            )
+            band_mask = (positions >= 0) & (positions < timesteps)
+            self._band_masks[key] = band_mask
+
+        return band_mask
+
+    def banded_attention(
+        self,
+        queries_per_head: torch.Tensor,
+        keys_per_head: torch.Tensor,
+        values_per_head: torch.Tensor,
+        window: int,
+    ) -> torch.Tensor:
+        """
+        Attention restricted to the `2 * window + 1` neighbours of every position.
+        The neighbours are gathered using unfold, so time and memory are O(timesteps * window).
+        """
+        timesteps = queries_per_head.shape[1]
+        # shape (num_heads * batch_size, dim, timesteps, 2 * window + 1)
+        keys_per_head = F.pad(
+            keys_per_head.transpose(1, 2), (window, window)
+        ).unfold(2, 2 * window + 1, 1)
+        values_per_head = F.pad(
+            values_per_head.transpose(1, 2), (window, window)
+        ).unfold(2, 2 * window + 1, 1)
+
+        # shape (num_heads * batch_size, timesteps, 2 * window + 1)
+        scaled_similarities = torch.einsum(
+            "btd,bdtw->btw", queries_per_head / self._scale, keys_per_head
+        )
+        attention = masked_softmax(
+            scaled_similarities,
+            self.get_band_mask(
+                timesteps, window, queries_per_head.device
+            ).unsqueeze(0),
+            memory_efficient=True,
+        )
+        attention = self._attention_dropout(attention)
+
+        # shape (num_heads * batch_size, timesteps, values_dim/num_heads)
+        return torch.einsum("btw,bdtw->btd", attention, values_per_head)
+
     @overrides
-    def forward(self, inputs: torch.Tensor, mask: torch.BoolTensor = None) -> torch.FloatTensor:
+    def forward(
+        self,
+        inputs: torch.Tensor,
+        mask: torch.BoolTensor = None,
+        window: Optional[int] = None,
+    ) -> torch.FloatTensor:
         """
         # Parameters
 
@@ -91,6 +157,10 @@ class SelfAttentionEncoder(Seq2SeqEncoder):
             A tensor of shape (batch_size, timesteps, input_dim)
         mask : `torch.BoolTensor`, optional (default = `None`).
             A tensor of shape (timesteps, timesteps).
+        window : `int`, optional (default = `None`).
+            If given, every position only attends to the positions within `window` of it.
+            This is equivalent to, but much cheaper than, passing a banded `mask`,
+            which is ignored in this case.
 
         # Returns
 
@@ -100,7 +170,7 @@ class SelfAttentionEncoder(Seq2SeqEncoder):
         num_heads = self._num_heads
 
         batch_size, timesteps, _ = inputs.size()
-        if mask is None:
+        if mask is None and window is None:
             mask = inputs.new_ones(timesteps, timesteps).bool()
 
         # Shape (batch_size, timesteps, 2 * attention_dim + values_dim)
@@ -139,24 +209,30 @@ class SelfAttentionEncoder(Seq2SeqEncoder):
             batch_size * num_heads, timesteps, int(self._attention_dim / num_heads)
         )
 
-        # shape (num_heads * batch_size, timesteps, timesteps)
-        scaled_similarities = torch.bmm(
-            queries_per_head / self._scale, keys_per_head.transpose(1, 2)
-        )
+        if window is not None:
+            # shape (num_heads * batch_size, timesteps, values_dim/num_heads)
+            outputs = self.banded_attention(
+                queries_per_head, keys_per_head, values_per_head, window
+            )
+        else:
+            # shape (num_heads * batch_size, timesteps, timesteps)
+            scaled_similarities = torch.bmm(
+                queries_per_head / self._scale, keys_per_head.transpose(1, 2)
+            )
 
-        # shape (num_heads * batch_size, timesteps, timesteps)
-        # Normalise the distributions, using the same mask for all heads.
-        attention = masked_softmax(
-            scaled_similarities,
-            mask.unsqueeze(0),
-            memory_efficient=True,
-        )
-        attention = self._attention_dropout(attention)
+            # shape (num_heads * batch_size, timesteps, timesteps)
+            # Normalise the distributions, using the same mask for all heads.
+            attention = masked_softmax(
+                scaled_similarities,
+                mask.unsqueeze(0),
+                memory_efficient=True,
+            )
+            attention = self._attention_dropout(attention)
 
-        # Take a weighted sum of the values with respect to the attention
-        # distributions for each element in the num_heads * batch_size dimension.
-        # shape (num_heads * batch_size, timesteps, values_dim/num_heads)
-        outputs = weighted_sum(values_per_head, attention)
+            # Take a weighted sum of the values with respect to the attention
+            # distributions for each element in the num_heads * batch_size dimension.
+            # shape (num_heads * batch_size, timesteps, values_dim/num_heads)
+            outputs = weighted_sum(values_per_head, attention)
 
         # Reshape back to original shape (batch_size, timesteps, values_dim)
         # shape (batch_size, num_heads, timesteps, values_dim/num_heads)
@@ -7,6 +7,9 @@ import allennlp.nn.util as util
 
 @ScoreNN.register("sequence-tagging")
 class SequenceTaggingScoreNN(ScoreNN):
+    caches_x_encoding = True
+    x_encoding_key = "y_local"
+
     def compute_local_score(  # type:ignore
         self,
         x: TextFieldTensors,
@@ -18,13 +21,13 @@ class SequenceTaggingScoreNN(ScoreNN):
         Args:
             y: tensor of labels of shape (batch, seq_len, tags)
         """
-        y_local = buffer.get("y_local")
+        y_local = buffer.get(self.x_encoding_key)
 
         if y_local is None:
-            y_local = self.task_nn(
+            y_local = self.encode_x(
                 x, buffer
             )  # (batch, ...) of unormalized logits
-            buffer["y_local"] = y_local
+            buffer[self.x_encoding_key] = y_local
 
         mask = buffer.get("mask")
 
@@ -59,6 +62,10 @@ class SequenceTaggingScoreNN(ScoreNN):
         buffer: Dict,
         **kwargs: Any,
     ) -> Optional[torch.Tensor]:
+        precomputed_score = self.get_precomputed_score(y, buffer)
+
+        if precomputed_score is not None:
+            return precomputed_score
         score = None
 
         local_score = self.compute_local_score(x, y, buffer=buffer)
@@ -1,9 +1,20 @@
+from typing import Optional
 from allennlp.common import Registrable
+import torch
 
 
 class StoppingCriteria(Registrable):
     default_implementation = "number-of-steps"
 
+    @property
+    def requires_loss_value(self) -> bool:
+        """Whether `__call__` looks at the `loss_value`.
+
+        Loops can avoid a host-device sync per step when this is False.
+        """
+
+        return True
+
     def __call__(self, step_number: int, loss_value: float) -> bool:
         raise NotImplementedError
 
@@ -14,5 +25,80 @@ class StopAfterNumberOfSteps(StoppingCriteria):
         super().__init__()
         self.number_of_steps = number_of_steps
 
+    @property
+    def requires_loss_value(self) -> bool:
+        return False
+
     def __call__(self, step_number: int, loss_value: float) -> bool:
         return step_number >= self.number_of_steps
+
+
+class PerInstanceStoppingCriteria(StopAfterNumberOfSteps):
+    """
+    Decides convergence separately for every `(batch, num_init_samples)` row.
+
+    `__call__` acts as the global cap on the number of steps, while
+    `converged` is used by the gradient descent loops to stop updating
+    (and stop scoring) the rows that have converged.
+    """
+
+    def converged(
+        self,
+        loss_values: torch.Tensor,  #: (batch, num_init_samples)
+        previous_loss_values: Optional[torch.Tensor],  #: same as loss_values
+        step: torch.Tensor,  #: (batch, num_init_samples, ...)
+    ) -> torch.Tensor:
+        """
+        Args:
+            step: The projected update of every row, i.e., the point after the optimizer
+                step and the projection onto the output space minus the point before.
+
+        Returns:
+            Bool tensor of shape (batch, num_init_samples) which is True for converged rows.
+        """
+        raise NotImplementedError
+
+
+@StoppingCriteria.register("per-instance-relative-loss-change")
+class StopOnRelativeLossChange(PerInstanceStoppingCriteria):
+    """A row has converged when its loss changes by less than `tolerance` (relative)."""
+
+    def __init__(self, number_of_steps: int = 10, tolerance: float = 1e-4):
+        super().__init__(number_of_steps)
+        self.tolerance = tolerance
+
+    def converged(
+        self,
+        loss_values: torch.Tensor,
+        previous_loss_values: Optional[torch.Tensor],
+        step: torch.Tensor,
+    ) -> torch.Tensor:
+        if previous_loss_values is None:
+            return torch.zeros_like(loss_values, dtype=torch.bool)
+        change = torch.abs(loss_values - previous_loss_values)
+
+        return change <= self.tolerance * torch.abs(
+            previous_loss_values
+        ).clamp_min(torch.finfo(loss_values.dtype).tiny)
+
+
+@StoppingCriteria.register("per-instance-gradient-norm")
+class StopOnGradientNorm(PerInstanceStoppingCriteria):
+    """A row has converged when the L2 norm of its projected step is below `tolerance`.
+
+    The projected step is used instead of the raw gradient because in a constrained
+    output space, like the [0, 1] box, the raw gradient does not vanish at an active bound
+    while the projected step does.
+    """
+
+    def __init__(self, number_of_steps: int = 10, tolerance: float = 1e-3):
+        super().__init__(number_of_steps)
+        self.tolerance = tolerance
+
+    def converged(
+        self,
+        loss_values: torch.Tensor,
+        previous_loss_values: Optional[torch.Tensor],
+        step: torch.Tensor,
+    ) -> torch.Tensor:
+        return torch.norm(step.flatten(2), dim=-1) <= self.tolerance
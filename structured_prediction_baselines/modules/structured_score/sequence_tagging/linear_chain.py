@@ -30,73 +30,48 @@ class LinearChain(StructuredScore):
         buffer: Dict,
         **kwargs: Any,
     ) -> torch.Tensor:
-        mask = buffer.get("mask")
+        mask = buffer.get("mask")  # [batch_size, seq_length]
         batch_size, n_samples, seq_length, _ = y.shape
-        targets = y.permute(
-            2, 0, 1, 3
-        )  # [seq_length, batch_size, n_samples, num_tags]
-        length_index = mask.sum(1).long() - 1  # [batch_size]
+        y = y.float()
+        mask = mask.unsqueeze(1)  # [batch_size, 1, seq_length]
+        length_index = mask.sum(-1).squeeze(1).long() - 1  # [batch_size]
+        K = min(self.M, seq_length)
 
-        trans_energy: Union[float, torch.Tensor] = 0.0
-        prev_labels = []
-
-        for t in range(seq_length):
-            energy_t = 0
-            target_t = targets[t].float()  # [batch_size, n_samples, num_tags]
-
-            if t < self.M:
-                prev_labels.append(target_t.view(-1, self.num_tags))
-                new_ta_energy = torch.mm(
-                    prev_labels[t], self.W[t, -1, :-1].unsqueeze(dim=1)
-                )
-                new_ta_energy = new_ta_energy.squeeze(dim=-1)
-                # [batch_size * n_samples, num_tags] x [num_tags, 1] -> [batch_size * n_samples]
-
-                energy_t += new_ta_energy.view(batch_size, n_samples) * mask[:, t].unsqueeze(-1)
-                # [batch_size, n_samples]
-
-                for i in range(t):
-                    new_ta_energy = torch.mm(
-                        prev_labels[t - 1 - i], self.W[i, :-1, :-1]
-                    )
-                    # [batch_size * n_samples, num_tags]
-
-                    energy_t += (
-                        (
-                            new_ta_energy.view(batch_size, n_samples, -1)
-                            * target_t
-                        ).sum(2)
-                    ) * mask[:, t].unsqueeze(-1)
-                    # [batch_size, n_samples]
-            else:
-                for i in range(self.M):
-                    new_ta_energy = torch.mm(
-                        prev_labels[self.M - 1 - i], self.W[i, :-1, :-1]
-                    )
-                    # [batch_size * n_samples, num_tags]
+        # transition from the start symbol to position t < M using W[t]
+        start_energy = torch.einsum(
+            "bstc,tc->bst", y[:, :, :K], self.W[:K, -1, :-1]
+        )
+        trans_energy = torch.sum(start_energy * mask[:, :, :K], dim=-1)
+        # [batch_size, n_samples]
 
-                    energy_t += (
-                        (
-                            new_ta_energy.view(batch_size, n_samples, -1)
-                            * target_t
-                        ).sum(2)
-                    ) * mask[:, t].unsqueeze(-1)
-                    # [batch_size, n_samples]
+        # transitions of order i+1, i.e., from position t-1-i to t, using W[i]
+        # computed for all t at once using shifted views of y
 
-                prev_labels.append(target_t.view(-1, self.num_tags))
-                prev_labels.pop(0)
-            trans_energy += energy_t
+        for i in range(min(self.M, seq_length - 1)):
+            energy = torch.einsum(
+                "bstc,cd,bstd->bst",
+                y[:, :, : seq_length - 1 - i],
+                self.W[i, :-1, :-1],
+                y[:, :, i + 1 :],
+            )  # [batch_size, n_samples, seq_length-1-i]
+            trans_energy = trans_energy + torch.sum(
+                energy * mask[:, :, i + 1 :], dim=-1
+            )
 
-        for i in range(min(self.M, seq_length)):
-            pos_end_target = y[
-                torch.arange(batch_size), :, length_index - i, :
-            ].float()
-            # [batch_size, n_samples, num_tags]
-            pos_end_energy = torch.mm(
-                pos_end_target.view(-1, self.num_tags),
-                self.W[i, :-1, -1].unsqueeze(1),
-            ).squeeze(1)
-            trans_energy += pos_end_energy.view(batch_size, n_samples)
-            # [batch_size, n_samples]
+        # transition from position length-1-i to the end symbol using W[i],
+        # only for the positions in the sequence, i.e., i < length.
+        end_offset = torch.arange(K, device=length_index.device)
+        end_index = length_index.unsqueeze(-1) - end_offset  # [batch_size, K]
+        pos_end_target = y[
+            torch.arange(batch_size, device=y.device).unsqueeze(-1),
+            :,
+            end_index.clamp_min(0),
+        ]  # [batch_size, K, n_samples, num_tags]
+        trans_energy = trans_energy + torch.einsum(
+            "bksc,kc,bk->bs",
+            pos_end_target,
+            self.W[:K, :-1, -1],
+            (end_index >= 0).to(dtype=y.dtype),
+        )
 
-        return trans_energy
+        return trans_energy  # [batch_size, n_samples]
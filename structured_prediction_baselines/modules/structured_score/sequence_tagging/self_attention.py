@@ -26,14 +26,10 @@ class SelfAttention(StructuredScore):
     ) -> torch.Tensor:
         mask = buffer["mask"]
         batch_size, n_samples, seq_length, _ = y.shape
-        attention_mask = torch.BoolTensor(seq_length, seq_length).fill_(False)
-        for i in range(seq_length):
-            lower_idx, higher_idx = max(0, i - self.M), min(seq_length, i + self.M + 1)
-            attention_mask[i][lower_idx:higher_idx] = True
-
+        # attend only to the positions within M, ie. banded attention
         attention_output = self.attention_layer(
             y.view(batch_size * n_samples, seq_length, -1),
-            attention_mask
+            window=self.M,
         )  # (batch_size * n_samples, seq_length, num_tags)
 
         attention_output = attention_output.view(
@@ -67,6 +67,63 @@ class VKP(StructuredScore):
             return trans_energy
 
 
+@StructuredScore.register("vkp-cp")
+class FactorizedVKP(StructuredScore):
+    """Low rank (CP decomposed) version of the Vectorized Kronecker Product High Order Energy
+
+    The (M+1)-way transition tensor of :class:`VKP` is represented as
+    `W[a_0,...,a_M] = sum_r U[0, a_0, r] * ... * U[M, a_M, r]`, where the last
+    index of each factor is the start symbol. The energy at position t is
+    `W[y_{t-M},...,y_t]`, with the start symbol before the sequence, which is
+    contracted factor by factor. Hence, the cost is linear in M and in C*rank
+    instead of C^(M+1).
+    """
+
+    def __init__(self, num_tags: int, M: int, rank: int = 32, **kwargs: Any):
+        super().__init__()
+        self.num_tags = num_tags
+        self.M = M
+        self.rank = rank
+        # scale the factors so that the entries of the implied W
+        # have the same variance as the uniform(-0.02, 0.02) init of VKP
+        bound = np.sqrt(3 * (0.02 ** 2 / (3 * rank)) ** (1.0 / (M + 1)))
+        self.U = nn.Parameter(
+            torch.FloatTensor(
+                np.random.uniform(
+                    -bound, bound, (self.M + 1, num_tags + 1, rank)
+                ).astype("float32")
+            )
+        )
+
+    def forward(
+        self,
+        y: torch.Tensor,  #: (batch, num_samples, seq_len, num_tags)
+        buffer: Dict,
+        **kwargs: Any,
+    ) -> torch.Tensor:
+        mask = buffer.get("mask")  # (batch, seq_len)
+        B, S, T, C = y.shape
+        # project every position on all the factors at once
+        projected = torch.einsum(
+            "bstc,jcr->jbstr", y.to(dtype=self.U.dtype), self.U[:, :-1]
+        )  # [M+1, B, S, T, rank]
+        energy: Union[float, torch.Tensor] = 1.0
+
+        for j in range(self.M + 1):
+            # factor j sees position t-(M-j), or the start symbol before the sequence
+            shift = min(self.M - j, T)
+            start = self.U[j, -1].expand(B, S, shift, self.rank)
+            energy = energy * torch.cat(
+                (start, projected[j, :, :, : T - shift]), dim=2
+            )  # [B, S, T, rank]
+        energy = torch.sum(energy, dim=-1)  # [B, S, T]
+
+        if mask is not None:
+            energy = energy * mask.reshape(B, 1, T)
+
+        return torch.sum(energy, dim=-1)  # [B, S]
+
+
 def _get_end_trans(trans, K, M, maxM):
     assert M <= maxM
     if M == 1:
@@ -0,0 +1,59 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from structured_prediction_baselines.dataset_readers.multilabel_classification import (
+    arff_reader,
+)
+from structured_prediction_baselines.dataset_readers.multilabel_classification.arff_reader import (
+    ARFFReader,
+)
+
+X = np.arange(4, dtype=np.single)
+LABELS = ["a", "c"]
+
+
+def test_metadata_keeps_only_the_requested_keys() -> None:
+    reader = ARFFReader(num_labels=3, metadata_keys=["idx"])
+    meta: dict = {}
+    fields = reader.example_to_fields(X, LABELS, idx="7", meta=meta)
+
+    assert meta == {"idx": "7"}
+    assert set(fields) == {"x", "labels"}
+
+
+def test_metadata_keeps_all_keys_by_default() -> None:
+    reader = ARFFReader(num_labels=3)
+    meta: dict = {}
+    reader.example_to_fields(X, LABELS, idx="7", meta=meta)
+
+    assert set(meta) == set(ARFFReader.all_metadata_keys)
+    assert meta["labels"] == LABELS
+    assert meta["idx"] == "7"
+    assert not meta["using_tc"]
+
+
+def test_unknown_metadata_keys() -> None:
+    with pytest.raises(ValueError):
+        ARFFReader(num_labels=3, metadata_keys=["idx", "features"])
+
+
+def test_parses_serially_in_a_daemonic_process(monkeypatch) -> None:
+    files = ["fold1.arff", "fold2.arff"]
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("daemonic processes cannot have children")
+
+    monkeypatch.setattr(arff_reader.glob, "glob", lambda *a, **k: files)
+    monkeypatch.setattr(arff_reader, "ProcessPoolExecutor", no_pool)
+    monkeypatch.setattr(multiprocessing.current_process(), "daemon", True)
+    reader = ARFFReader(num_labels=2, num_parsing_workers=2)
+    monkeypatch.setattr(
+        reader,
+        "load_fold",
+        lambda file_: (np.eye(2), np.eye(2, dtype=int), ["a", "b"]),
+    )
+    data = reader.read_internal("fold@(1|2).arff")
+
+    assert len(data) == 4
@@ -0,0 +1,91 @@
+from typing import Callable, List
+
+import pytest
+import torch
+from allennlp.common.lazy import Lazy
+
+from structured_prediction_baselines.modules.sampler.gradient_based_inference import (
+    BestSamplePicker,
+    FusedGradientDescentLoop,
+    GradientDescentLoop,
+    LastNSamplePicker,
+    SamplePicker,
+)
+
+BATCH_SIZE, NUM_INIT_SAMPLES, NUM_LABELS = 4, 3, 6
+
+
+def lazy_optimizer(name: str) -> Lazy:
+    def construct(model_parameters: List) -> torch.optim.Optimizer:
+        parameters = [p for _, p in model_parameters]
+
+        if name == "adam":
+            return torch.optim.Adam(parameters, lr=0.05)
+
+        return torch.optim.SGD(parameters, lr=0.1, momentum=0.9)
+
+    return Lazy(construct)
+
+
+def make_loss_fn() -> Callable[[torch.Tensor], torch.Tensor]:
+    target = torch.rand(BATCH_SIZE, 1, NUM_LABELS)
+    W = torch.randn(NUM_LABELS, NUM_LABELS)
+
+    def loss_fn(inp: torch.Tensor) -> torch.Tensor:
+        z = inp - target
+
+        return (z ** 2).sum(-1) + 0.3 * torch.sin(z @ W).sum(-1)
+
+    return loss_fn
+
+
+def projection(inp: torch.Tensor) -> None:
+    with torch.no_grad():
+        inp.clamp_(0, 1)
+
+
+def run(
+    loop: GradientDescentLoop,
+    picker: SamplePicker,
+    stop: Callable,
+    num_steps: int = None,
+) -> List:
+    torch.manual_seed(1)
+    loss_fn = make_loss_fn()
+    init = torch.rand(BATCH_SIZE, NUM_INIT_SAMPLES, NUM_LABELS)
+    samples, losses, loss_values = loop(
+        init, loss_fn, stop, projection, accumulator=picker.accumulator(num_steps)
+    )
+
+    return [
+        torch.cat(samples, dim=1),
+        torch.cat([loss.reshape(-1) for loss in losses]),
+        loss_values,
+    ]
+
+
+@pytest.mark.parametrize("optimizer", ["adam", "sgd"])
+@pytest.mark.parametrize("picker", [LastNSamplePicker(0.4), BestSamplePicker()])
+def test_fused_loop_matches_basic_loop(
+    optimizer: str, picker: SamplePicker
+) -> None:
+    basic = run(GradientDescentLoop(lazy_optimizer(optimizer)), picker, 7, 7)
+    fused = run(
+        FusedGradientDescentLoop(lazy_optimizer(optimizer)), picker, 7, 7
+    )
+    assert torch.allclose(basic[0], fused[0], atol=1e-6)
+    assert torch.allclose(basic[1], fused[1], atol=1e-6)
+    assert basic[2] == pytest.approx(fused[2], abs=1e-5)
+
+
+def test_fused_loop_stops_with_basic_loop_on_loss_criteria() -> None:
+    def stop(step_number: int, loss_value: float) -> bool:
+        return step_number >= 30 or loss_value < 2.5
+
+    basic = run(GradientDescentLoop(lazy_optimizer("sgd")), BestSamplePicker(), stop)
+    fused = run(
+        FusedGradientDescentLoop(lazy_optimizer("sgd")), BestSamplePicker(), stop
+    )
+    assert 1 < len(basic[2]) < 31
+    assert len(basic[2]) == len(fused[2])
+    assert torch.allclose(basic[0], fused[0], atol=1e-6)
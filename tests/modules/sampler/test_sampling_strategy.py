@@ -0,0 +1,72 @@
+import pytest
+import torch
+from allennlp.common.checks import ConfigurationError
+
+from structured_prediction_baselines.modules.sampler.sampling_strategy import (
+    AntitheticSampling,
+    IIDSampling,
+    LeaveOneOutSampling,
+    SamplingStrategy,
+    SobolSampling,
+)
+
+BATCH_SIZE = 3
+NUM_LABELS = 6
+
+
+@pytest.mark.parametrize("num_samples", [4, 5])
+def test_antithetic_pairs(num_samples: int) -> None:
+    torch.manual_seed(0)
+    u = AntitheticSampling().uniforms(
+        BATCH_SIZE, num_samples, NUM_LABELS, torch.float, torch.device("cpu")
+    )
+    num_pairs = num_samples // 2
+
+    assert u.shape == (BATCH_SIZE, num_samples, NUM_LABELS)
+    assert torch.allclose(
+        u[:, :num_pairs] + u[:, num_pairs : 2 * num_pairs],
+        torch.ones(BATCH_SIZE, num_pairs, NUM_LABELS),
+    )
+
+    if num_samples % 2:
+        # the unpaired sample is a fresh draw
+        assert not torch.allclose(u[:, -1], 1.0 - u[:, 0])
+
+
+@pytest.mark.parametrize(
+    "strategy", [IIDSampling(), AntitheticSampling(), SobolSampling(seed=0)]
+)
+def test_sample_mean(strategy: SamplingStrategy) -> None:
+    torch.manual_seed(0)
+    probs = torch.rand(BATCH_SIZE, 1, NUM_LABELS)
+    samples = strategy.sample(probs, 4096)
+
+    assert samples.shape == (BATCH_SIZE, 4096, NUM_LABELS)
+    assert set(samples.unique().tolist()) <= {0.0, 1.0}
+    assert torch.allclose(samples.mean(dim=1), probs.squeeze(1), atol=0.05)
+
+
+@pytest.mark.parametrize("strategy_class", [AntitheticSampling, SobolSampling])
+def test_leave_one_out_needs_independent_samples(strategy_class) -> None:
+    with pytest.raises(ConfigurationError):
+        strategy_class(leave_one_out_baseline=True)
+
+
+def test_leave_one_out_baseline() -> None:
+    torch.manual_seed(0)
+    weights = torch.randn(BATCH_SIZE, 4, NUM_LABELS)
+    expected = torch.stack(
+        [
+            weights[:, i]
+            - torch.cat([weights[:, :i], weights[:, i + 1 :]], dim=1).mean(1)
+            for i in range(4)
+        ],
+        dim=1,
+    )
+
+    assert torch.allclose(LeaveOneOutSampling().baseline(weights), expected)
+    assert torch.equal(IIDSampling().baseline(weights), weights)
+    # nothing to leave out with a single sample
+    assert torch.equal(
+        LeaveOneOutSampling().baseline(weights[:, :1]), weights[:, :1]
+    )
@@ -0,0 +1,98 @@
+import itertools
+from typing import List, Tuple
+
+import pytest
+import torch
+
+from structured_prediction_baselines.modules.sampler.sequence_tagging.viterbi import (
+    ViterbiSampler,
+)
+from structured_prediction_baselines.modules.score_nn import ScoreNN
+from structured_prediction_baselines.modules.structured_score.sequence_tagging.linear_chain import (
+    LinearChain,
+)
+from structured_prediction_baselines.modules.structured_score.sequence_tagging.skip_chain import (
+    SkipChain,
+)
+
+NUM_TAGS = 3
+SEQ_LEN = 4
+
+
+def make_chain(M: int) -> LinearChain:
+    chain = LinearChain(NUM_TAGS) if M == 1 else SkipChain(NUM_TAGS, M=M)
+    with torch.no_grad():
+        chain.W.normal_()
+
+    return chain
+
+
+def brute_force(
+    chain: LinearChain, y_local: torch.Tensor, mask: torch.Tensor
+) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+    """Scores all the taggings of every sequence, with the padded positions tagged 0.
+
+    Returns:
+        for every sequence, the scores (num_taggings,)
+        and the taggings (num_taggings, seq_len)
+    """
+    all_scores, all_tags = [], []
+
+    for b in range(y_local.shape[0]):
+        length = int(mask[b].sum())
+        tags = torch.tensor(
+            [
+                list(t) + [0] * (SEQ_LEN - length)
+                for t in itertools.product(range(NUM_TAGS), repeat=length)
+            ]
+        )  # (num_taggings, seq_len)
+        y = torch.nn.functional.one_hot(tags, NUM_TAGS).float().unsqueeze(0)
+        local = torch.sum(y_local[b] * y[0] * mask[b].unsqueeze(-1), dim=(-1, -2))
+        with torch.no_grad():
+            glob = chain(y, {"mask": mask[b : b + 1]})[0]
+        all_scores.append(local + glob)
+        all_tags.append(tags)
+
+    return all_scores, all_tags
+
+
+@pytest.mark.parametrize("M", [1, 2, 3])
+@pytest.mark.parametrize("num_samples", [1, 4])
+def test_viterbi_matches_brute_force(M: int, num_samples: int) -> None:
+    torch.manual_seed(M)
+    chain = make_chain(M)
+    sampler = ViterbiSampler(
+        score_nn=ScoreNN(torch.nn.Identity(), chain), num_samples=num_samples
+    )
+    # lengths shorter than, equal to and longer than M
+    lengths = torch.tensor([1, 2, 3, 4])
+    mask = torch.arange(SEQ_LEN).unsqueeze(0) < lengths.unsqueeze(-1)
+    y_local = torch.randn(len(lengths), SEQ_LEN, NUM_TAGS)
+
+    tags = sampler.decode(y_local, mask, num_samples)
+    assert tags.shape == (len(lengths), num_samples, SEQ_LEN)
+    scores, taggings = brute_force(chain, y_local, mask)
+
+    for b in range(len(lengths)):
+        expected = torch.sort(scores[b], descending=True).values[:num_samples]
+        decoded = tags[b] * mask[b]  # padded tags do not change the score
+        decoded_scores = torch.stack(
+            [
+                scores[b][(taggings[b] == d).all(-1)].squeeze(0)
+                for d in decoded[: len(expected)]
+            ]
+        )
+        assert torch.allclose(decoded_scores, expected, atol=1e-5)
+
+
+def test_linear_chain_ignores_padded_tags() -> None:
+    torch.manual_seed(0)
+    chain = make_chain(3)
+    mask = torch.tensor([[True, False, False, False]])
+    y = torch.nn.functional.one_hot(
+        torch.randint(NUM_TAGS, (1, 2, SEQ_LEN)), NUM_TAGS
+    ).float()
+    y[:, 1, 0] = y[:, 0, 0]  # same tag at the only position in the sequence
+    with torch.no_grad():
+        scores = chain(y, {"mask": mask})
+    assert torch.allclose(scores[:, 0], scores[:, 1])
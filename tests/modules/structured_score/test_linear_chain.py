@@ -0,0 +1,63 @@
+from typing import Union
+
+import pytest
+import torch
+
+from structured_prediction_baselines.modules.structured_score.sequence_tagging.linear_chain import (
+    LinearChain,
+)
+from structured_prediction_baselines.modules.structured_score.sequence_tagging.skip_chain import (
+    SkipChain,
+)
+
+BATCH_SIZE = 3
+NUM_SAMPLES = 4
+SEQ_LEN = 7
+NUM_TAGS = 5
+
+
+def loop_score(
+    chain: LinearChain,
+    y: torch.Tensor,  #: (batch, num_samples, seq_len, num_tags)
+    mask: torch.Tensor,  #: (batch, seq_len)
+) -> torch.Tensor:
+    """Reference: the position by position loop the chain used to run."""
+    W, M = chain.W, chain.M
+    batch_size, n_samples, seq_length, _ = y.shape
+    length_index = mask.sum(1).long() - 1
+    trans_energy: Union[float, torch.Tensor] = 0.0
+
+    for t in range(seq_length):
+        m_t = mask[:, t].unsqueeze(-1)  # (batch, 1)
+
+        if t < M:
+            trans_energy = trans_energy + (y[:, :, t] @ W[t, -1, :-1]) * m_t
+
+        for i in range(min(t, M)):
+            trans_energy = trans_energy + torch.sum(
+                (y[:, :, t - 1 - i] @ W[i, :-1, :-1]) * y[:, :, t], dim=-1
+            ) * m_t
+
+    for i in range(min(M, seq_length)):
+        pos_end_target = y[torch.arange(batch_size), :, length_index - i]
+        trans_energy = trans_energy + pos_end_target @ W[i, :-1, -1]
+
+    return trans_energy  # (batch, num_samples)
+
+
+@pytest.mark.parametrize("M", [1, 2, 3])
+def test_matches_loop(M: int) -> None:
+    torch.manual_seed(M)
+    chain = LinearChain(NUM_TAGS) if M == 1 else SkipChain(NUM_TAGS, M=M)
+    with torch.no_grad():
+        chain.W.normal_()
+    y = torch.rand(BATCH_SIZE, NUM_SAMPLES, SEQ_LEN, NUM_TAGS)
+    mask = torch.ones(BATCH_SIZE, SEQ_LEN)
+    # the loop is only right for sequences of at least M tags
+    mask[0, 5:] = 0
+    mask[1, 3:] = 0
+    score = chain(y, {"mask": mask})
+    expected = loop_score(chain, y, mask)
+
+    assert score.shape == (BATCH_SIZE, NUM_SAMPLES)
+    assert torch.allclose(score, expected, atol=1e-5)
@@ -0,0 +1,41 @@
+import torch
+from allennlp.data.vocabulary import Vocabulary
+from allennlp.modules.feedforward import FeedForward
+from allennlp.modules.token_embedders.embedding import Embedding
+from allennlp.nn import Activation
+
+from structured_prediction_baselines.modules.multilabel_classification_task_nn import (
+    MultilabelTaskNN,
+)
+
+BATCH_SIZE = 4
+NUM_FEATURES = 10
+NUM_LABELS = 3
+
+
+def make_task_nn() -> MultilabelTaskNN:
+    return MultilabelTaskNN(
+        Vocabulary(),
+        FeedForward(6, 2, [8, 5], Activation.by_name("relu")()),
+        Embedding(embedding_dim=5, num_embeddings=NUM_LABELS),
+        input_dim=NUM_FEATURES,
+    )
+
+
+def test_sparse_input_projection() -> None:
+    torch.manual_seed(0)
+    task_nn = make_task_nn()
+    x = torch.randn(BATCH_SIZE, NUM_FEATURES)
+    x[torch.rand(BATCH_SIZE, NUM_FEATURES) < 0.7] = 0.0
+    logits = task_nn(x, {})
+    (grad,) = torch.autograd.grad(
+        logits.sum(), task_nn.input_projection.weight
+    )
+    sparse_logits = task_nn(x.to_sparse(), {})
+    (sparse_grad,) = torch.autograd.grad(
+        sparse_logits.sum(), task_nn.input_projection.weight
+    )
+
+    assert logits.shape == (BATCH_SIZE, NUM_LABELS)
+    assert torch.allclose(sparse_logits, logits, atol=1e-6)
+    assert torch.allclose(sparse_grad, grad, atol=1e-6)
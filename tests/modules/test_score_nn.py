@@ -0,0 +1,61 @@
+from typing import Dict
+
+import torch
+
+from structured_prediction_baselines.modules.multilabel_classification_score_nn import (
+    MultilabelClassificationScoreNN,
+)
+from structured_prediction_baselines.modules.task_nn import TaskNN
+
+BATCH_SIZE = 3
+NUM_FEATURES = 5
+NUM_LABELS = 4
+
+
+class CountingTaskNN(TaskNN):
+    def __init__(self) -> None:
+        super().__init__()
+        self.linear = torch.nn.Linear(NUM_FEATURES, NUM_LABELS)
+        self.num_calls = 0
+
+    def forward(self, x: torch.Tensor, buffer: Dict) -> torch.Tensor:
+        self.num_calls += 1
+
+        return self.linear(x)
+
+
+def test_cached_x_encoding_runs_the_task_nn_once() -> None:
+    torch.manual_seed(0)
+    task_nn = CountingTaskNN()
+    score_nn = MultilabelClassificationScoreNN(task_nn)
+    x = torch.randn(BATCH_SIZE, NUM_FEATURES)
+    ys = [torch.rand(BATCH_SIZE, n, NUM_LABELS) for n in (1, 2, 5)]
+    expected = [score_nn(x, y, {}) for y in ys]
+    task_nn.num_calls = 0
+    buffer: Dict = {}
+
+    with score_nn.cached_x_encoding(x, buffer):
+        # nested contexts reuse the outer encoding
+        with score_nn.cached_x_encoding(x, buffer):
+            scores = [score_nn(x, y, buffer) for y in ys]
+
+    assert task_nn.num_calls == 1
+    assert score_nn.x_encoding_key not in buffer
+
+    for score, expected_score in zip(scores, expected):
+        assert score.shape == expected_score.shape
+        assert torch.allclose(score, expected_score)
+
+
+def test_cached_x_encoding_keeps_gradients_wrt_y() -> None:
+    torch.manual_seed(0)
+    score_nn = MultilabelClassificationScoreNN(CountingTaskNN())
+    x = torch.randn(BATCH_SIZE, NUM_FEATURES)
+    y = torch.rand(BATCH_SIZE, 2, NUM_LABELS, requires_grad=True)
+    (expected,) = torch.autograd.grad(score_nn(x, y, {}).sum(), y)
+    buffer: Dict = {}
+
+    with score_nn.cached_x_encoding(x, buffer):
+        (grad,) = torch.autograd.grad(score_nn(x, y, buffer).sum(), y)
+
+    assert torch.allclose(grad, expected)